@@ -0,0 +1,122 @@
+"""Compares AntispamEngine with the character-by-character antispam_text it replaced.
+
+Run from the repository root: python benchmarks/antispam_benchmark.py
+"""
+import importlib.util
+import random
+import timeit
+
+spec = importlib.util.spec_from_file_location('antispam', 'copy_maker/antispam.py')
+antispam = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(antispam)
+
+LIFT_BLOCK = '''
+<tr>
+  <td align="left" style="font-size:0px;padding:10px 25px;word-break:break-word;">
+    <div style="font-family:Roboto, Helvetica, Arial, sans-serif;font-size:16px;line-height:1.5;text-align:left;color:#000000;">
+      Dear Customer, Our EXCLUSIVE offer is here &ndash; save 50% today &amp; get free shipping on orders over &#36;49!
+      Claim your bonus before it expires &#128293; and discover what thousands of happy members already know.
+      <a href="https://example.com/click?id=123&amp;utm_source=mail" style="color:#1a73e8;text-decoration:underline;">Click here to see more</a>
+    </div>
+  </td>
+</tr>
+<tr>
+  <td align="center" style="font-size:0px;padding:10px 25px;word-break:break-word;">
+    <table border="0" cellpadding="0" cellspacing="0" role="presentation" style="border-collapse:separate;line-height:100%;">
+      <tr>
+        <td align="center" bgcolor="#28B628" role="presentation" style="border:none;border-radius:3px;background:#28B628;" valign="middle">
+          <a href="urlhere" style="display:inline-block;background:#28B628;color:#ffffff;font-family:Roboto, Helvetica, Arial, sans-serif;font-size:18px;" target="_blank">GET STARTED NOW &rarr;</a>
+        </td>
+      </tr>
+    </table>
+  </td>
+</tr>
+'''
+
+LIFT_SIZES = [('small lift', 10), ('typical lift', 60), ('large MJML export', 400)]
+CUSTOM_REPLACEMENTS = {'&ndash;': '-', 'u': 'υ'}
+
+
+def legacy_antispam_text(text, custom_replacements):
+    replacements = {**antispam.ANTISPAM_REPLACEMENTS, **custom_replacements}
+
+    new_text = ''
+    inside_tag = False
+    inside_str_emoji = False
+    str_emoji = ''
+    fake_str_emoji = ''
+
+    for char in text:
+        match char:
+            case '<':
+                inside_tag = True
+
+            case '>':
+                inside_tag = False
+
+            case '&':
+                if inside_str_emoji:
+                    new_text += fake_str_emoji
+                    str_emoji = ''
+                    fake_str_emoji = ''
+
+                inside_str_emoji = True
+
+            case ';':
+                inside_str_emoji = False
+                str_emoji += char
+                fake_str_emoji += replacements.get(char) or char
+                replaced_char = replacements.get(str_emoji)
+                new_text += replaced_char or fake_str_emoji
+
+                str_emoji = ''
+                fake_str_emoji = ''
+                continue
+
+        if inside_str_emoji:
+            str_emoji += char
+            fake_str_emoji += replacements.get(char) or char
+            continue
+
+        if (not inside_tag) and (not inside_str_emoji):
+            replaced_char = replacements.get(char) or char
+        else:
+            replaced_char = char
+
+        new_text += replaced_char
+
+    if inside_str_emoji:
+        new_text += fake_str_emoji
+
+    return new_text
+
+
+def check_random_texts(count=20000):
+    alphabet = list('<>&;#36 aAeEiIoOcuxy%$"=/\n') + ['&#36;', '&amp;', '&ndash;', '<a href="']
+    for _ in range(count):
+        text = ''.join(random.choice(alphabet) for _ in range(random.randint(0, 60)))
+        if legacy_antispam_text(text, CUSTOM_REPLACEMENTS) != antispam.AntispamEngine(CUSTOM_REPLACEMENTS).apply(text):
+            raise AssertionError(f'Output differs for {text!r}')
+
+
+def main():
+    check_random_texts()
+    engine = antispam.AntispamEngine.get(CUSTOM_REPLACEMENTS)
+
+    print(f'{"lift":<20}{"size":>10}{"legacy ms":>12}{"engine ms":>12}{"speedup":>10}')
+    for name, blocks in LIFT_SIZES:
+        lift = LIFT_BLOCK * blocks
+        if legacy_antispam_text(lift, CUSTOM_REPLACEMENTS) != engine.apply(lift):
+            raise AssertionError(f'Output differs for {name}')
+
+        runs = max(1, 200 // blocks)
+        legacy_seconds = min(timeit.repeat(lambda: legacy_antispam_text(lift, CUSTOM_REPLACEMENTS),
+                                           number=runs, repeat=3)) / runs
+        engine_seconds = min(timeit.repeat(lambda: engine.apply(lift), number=runs, repeat=3)) / runs
+
+        print(f'{name:<20}{len(lift) // 1024:>8} KB{legacy_seconds * 1000:>12.2f}{engine_seconds * 1000:>12.2f}'
+              f'{legacy_seconds / engine_seconds:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
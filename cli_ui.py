@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import platform
@@ -7,11 +8,16 @@ from datetime import datetime
 import questionary
 from prompt_toolkit.styles import Style
 
-from core import core
+import startup_report
+from core import Core, get_core
 
 logger = logging.getLogger(__name__)
 
 
+class CopiesInputDeferred(Exception):
+    pass
+
+
 class CliUI:
     autocomplete_style = Style.from_dict({
         "completion-menu.completion": "bg:#444444 ansiwhite",
@@ -22,8 +28,10 @@ class CliUI:
 
     @classmethod
     def start(cls):
+        Core.check_paths()
         cls.clear_console()
         questionary.print('Welcome to copy-helper')
+        startup_report.report_ready()
         while True:
             try:
                 cls.main_cycle()
@@ -35,7 +43,7 @@ class CliUI:
                     choices=['exit'], ignore_case=True,
                     match_middle=True, style=cls.autocomplete_style).ask().strip().lower()
                 if retry == 'exit':
-                    core.exit()
+                    Core.exit()
 
     @classmethod
     def main_cycle(cls):
@@ -48,9 +56,10 @@ class CliUI:
             'add-domain': cls.add_domain,
             # 'edit-domain':cls.edit_domain,
             'clear-cache': cls.clear_cache,
+            'cache-info': cls.cache_info,
             'clear': cls.clear_console,
-            'restart': core.restart_script,
-            'exit': core.exit
+            'restart': Core.restart_script,
+            'exit': Core.exit
         }
 
         menu_options_to_show = menu_options.copy()
@@ -74,26 +83,29 @@ class CliUI:
 
     @classmethod
     def make_all(cls):
+        core = get_core()
         broadcast_date = questionary.text("Enter broadcast date:",
                                           default=f"{datetime.today().month}/{datetime.today().day}").ask().strip()
         if broadcast_date == 'back':
             return
 
-        questionary.print(f'Staring making all domains : {", ".join(sorted(core.domains))}')
+        domain_names = core.domains.names()
+        questionary.print(f'Staring making all domains : {", ".join(domain_names)}')
+        core.start_run()
+        core.prefetch_domains(domain_names, broadcast_date)
 
-        domains_results = []
-        for domain_name in sorted(core.domains):
-            questionary.print(f'Making domain: {domain_name}')
-            try:
-                domain_results = core.make_domain(domain_name, broadcast_date, cls.get_str_copies, str_copies=None)
-            except Exception as e:
-                logger.error(f'Error while making domain {domain_name}. Details: {e}')
-                logger.debug(traceback.format_exc())
-                continue
+        workers = core.settings.get('MakeAllWorkers', 1)
+        if workers > 1:
+            domains_results = cls.make_domains_concurrently(domain_names, broadcast_date, workers)
+        else:
+            domains_results = {}
+            for domain_name in domain_names:
+                domain_results = cls.make_one_of_all_domains(domain_name, broadcast_date, cls.get_str_copies)
+                if domain_results is not None:
+                    domains_results[domain_name] = domain_results
 
-            domains_results.append({'name': domain_name, 'results': domain_results})
-            questionary.print(f'Finished making domain {domain_name} for date {broadcast_date}')
-            questionary.print('\n')
+        domains_results = [{'name': domain_name, 'results': domains_results[domain_name]}
+                           for domain_name in domain_names if domain_name in domains_results]
 
         questionary.print('======================')
         questionary.print('Finished making all domains')
@@ -106,11 +118,58 @@ class CliUI:
 
         questionary.print('======================')
 
+    @classmethod
+    def make_domains_concurrently(cls, domain_names, broadcast_date, workers):
+        core = get_core()
+        questionary.print(f'Making domains: {", ".join(domain_names)}')
+        all_domains_results = asyncio.run(core.make_all_async(domain_names, broadcast_date, cls.defer_str_copies,
+                                                              workers))
+
+        domains_results, deferred_domain_names = {}, []
+        for domain_name, domain_results in all_domains_results.items():
+            if isinstance(domain_results, CopiesInputDeferred):
+                deferred_domain_names.append(domain_name)
+                continue
+
+            if isinstance(domain_results, Exception):
+                logger.error(f'Error while making domain {domain_name}. Details: {domain_results}')
+                logger.debug(''.join(traceback.format_exception(domain_results)))
+                continue
+
+            questionary.print(f'Finished making domain {domain_name} for date {broadcast_date}')
+            domains_results[domain_name] = domain_results
+
+        questionary.print('\n')
+
+        for domain_name in sorted(deferred_domain_names):
+            domain_results = cls.make_one_of_all_domains(domain_name, broadcast_date, cls.get_str_copies)
+            if domain_results is not None:
+                domains_results[domain_name] = domain_results
+
+        return domains_results
+
+    @classmethod
+    def make_one_of_all_domains(cls, domain_name, broadcast_date, get_str_copies):
+        core = get_core()
+        questionary.print(f'Making domain: {domain_name}')
+        try:
+            domain_results = core.make_domain(domain_name, broadcast_date, get_str_copies, str_copies=None)
+        except Exception as e:
+            logger.error(f'Error while making domain {domain_name}. Details: {e}')
+            logger.debug(traceback.format_exc())
+            return None
+
+        questionary.print(f'Finished making domain {domain_name} for date {broadcast_date}')
+        questionary.print('\n')
+        return domain_results
+
     @classmethod
     def make_domain(cls):
-        questionary.print(f'Domains : {", ".join(sorted(core.domains))}')
+        core = get_core()
+        domain_names = core.domains.names()
+        questionary.print(f'Domains : {", ".join(domain_names)}')
 
-        choices = {**core.domains, 'back': ''}
+        choices = [*domain_names, 'back']
         domain_name = questionary.autocomplete("Choose domain:",
                                                choices=choices,
                                                validate=lambda val: val in choices,
@@ -131,6 +190,7 @@ class CliUI:
             return
 
         str_copies = str_copies.split(' ') if str_copies else None
+        core.start_run()
         try:
             domain_results = core.make_domain(domain_name, broadcast_date, cls.get_str_copies, str_copies)
         except Exception as e:
@@ -164,6 +224,10 @@ class CliUI:
 
         #         break
 
+    @classmethod
+    def defer_str_copies(cls):
+        raise CopiesInputDeferred()
+
     @classmethod
     def get_str_copies(cls):
         str_copies = questionary.text(
@@ -173,12 +237,14 @@ class CliUI:
 
     @classmethod
     def add_domain(cls):
+        core = get_core()
         new_domain_name = questionary.text("Enter new domain name:").ask().strip()
         if new_domain_name == 'back':
             return
 
-        questionary.print(f'Choose domain to copy from : {", ".join(sorted(core.domains))}')
-        choices = {**core.domains, 'back': '', '': ''}
+        domain_names = core.domains.names()
+        questionary.print(f'Choose domain to copy from : {", ".join(domain_names)}')
+        choices = [*domain_names, 'back', '']
         template_domain_name = questionary.autocomplete("Template domain:",
                                                         choices=choices,
                                                         validate=lambda val: val in choices,
@@ -193,11 +259,22 @@ class CliUI:
 
     @classmethod
     def clear_cache(cls):
-        option = questionary.text("Specify offer to clear cache:").ask().strip()
+        core = get_core()
+        option = questionary.text(
+            'Specify offer to clear cache ("all" for everything, "misses" for remembered misses, '
+            '"drive-index" for Google Drive folders index, "files" for Google Drive files, "sheets" for Google Sheets responses):').ask().strip()
         if option == 'back':
             return
         core.clear_cache(option)
 
+    @classmethod
+    def cache_info(cls):
+        core = get_core()
+        questionary.print('======================')
+        for line in core.get_cache_info():
+            questionary.print(line)
+        questionary.print('======================')
+
     @staticmethod
     def clear_console():
         current_os = platform.system()
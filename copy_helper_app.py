@@ -1,3 +1,5 @@
+# Imported first, so the startup time it reports includes loading the cli
+import startup_report
 import cli_ui
 import logger
 
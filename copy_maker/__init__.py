@@ -1,3 +1,4 @@
+import importlib
 import logging
 import os
 
@@ -5,20 +6,21 @@ import default_config
 
 
 def check_files():
-    if not os.path.exists('copy_maker/offers_info_cache.json'):
-        open('copy_maker/offers_info_cache.json', 'w').write('{}')
-
     if not os.path.exists('copy_maker/secrets.json'):
         open('copy_maker/secrets.json', 'w').write(default_config.default_secret_file)
         logging.warning('Fill secrets file!')
         exit()
 
 
-def import_modules():
-    from . import domain
-    from . import offer
-    from . import styles_helper
+# Submodules are imported on first use, so the cli can draw its menu before google, docx and PIL are loaded
+LAZY_MODULES = ('domain', 'domain_registry', 'google_services', 'images', 'negative_cache', 'offer', 'styles_helper')
+
+
+def __getattr__(name):
+    if name in LAZY_MODULES:
+        return importlib.import_module(f'.{name}', __name__)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 check_files()
-import_modules()
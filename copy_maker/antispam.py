@@ -0,0 +1,98 @@
+import logging
+import re
+
+ANTISPAM_REPLACEMENTS = {
+    "A": "А",
+    "E": "Е",
+    "I": "І",
+    "O": "О",
+    "P": "Р",
+    "T": "Т",
+    "H": "Н",
+    "K": "К",
+    "X": "Х",
+    "C": "С",
+    "B": "В",
+    "M": "М",
+    "e": "е",
+    "y": "у",
+    "i": "і",
+    "o": "о",
+    "a": "а",
+    "x": "х",
+    "c": "с",
+    "%": "％",
+    "$": "＄",
+    "&#36;": "＄"
+}
+
+# str.translate is several times faster with a list indexed by code point than with a dict,
+# characters past the end of the list are left as they are
+TRANSLATE_TABLE_SIZE = 0x3000
+IDENTITY_TRANSLATE_TABLE = [chr(code_point) for code_point in range(TRANSLATE_TABLE_SIZE)]
+
+logger = logging.getLogger(__name__)
+
+
+class AntispamEngine:
+    # & starts an entity that runs up to the next ; or &, < and > switch between tag and text
+    tokenizer = re.compile(r'&[^&;]*;?|<[^&<>]*|>[^&<>]*|[^&<>]+')
+    engines = {}
+
+    def __init__(self, custom_replacements):
+        self.replacements = {**ANTISPAM_REPLACEMENTS, **custom_replacements}
+
+        chars_replacements = {char: replacement for char, replacement in self.replacements.items()
+                              if len(char) == 1 and replacement}
+        self.text_table = self.make_translate_table(chars_replacements)
+        self.tag_table = self.make_translate_table({';': chars_replacements[';']}) if ';' in chars_replacements else None
+
+    @staticmethod
+    def make_translate_table(chars_replacements):
+        table_size = max([TRANSLATE_TABLE_SIZE] + [ord(char) + 1 for char in chars_replacements])
+        table = IDENTITY_TRANSLATE_TABLE + [chr(code_point) for code_point in range(TRANSLATE_TABLE_SIZE, table_size)]
+        for char, replacement in chars_replacements.items():
+            table[ord(char)] = replacement
+
+        return table
+
+    @classmethod
+    def get(cls, custom_replacements):
+        key = tuple(custom_replacements.items())
+        engine = cls.engines.get(key)
+        if not engine:
+            logger.debug('Compiling antispam replacements')
+            engine = cls.engines[key] = cls(custom_replacements)
+
+        return engine
+
+    def apply(self, text):
+        parts = []
+        inside_tag = False
+        for token in self.tokenizer.findall(text):
+            match token[0]:
+                case '&':
+                    if token[-1] == ';' and (replaced_entity := self.replacements.get(token)):
+                        parts.append(replaced_entity)
+                    else:
+                        parts.append(token.translate(self.text_table))
+
+                    tag_start, tag_end = token.rfind('<'), token.rfind('>')
+                    if tag_start != tag_end:
+                        inside_tag = tag_start > tag_end
+
+                case '<':
+                    inside_tag = True
+                    parts.append('<' + token[1:].translate(self.tag_table) if self.tag_table else token)
+
+                case '>':
+                    inside_tag = False
+                    parts.append(token.translate(self.text_table))
+
+                case _ if inside_tag:
+                    parts.append(token.translate(self.tag_table) if self.tag_table else token)
+
+                case _:
+                    parts.append(token.translate(self.text_table))
+
+        return ''.join(parts)
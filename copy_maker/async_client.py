@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import threading
+
+MAX_CONNECTIONS = 100
+MAX_CONNECTIONS_PER_HOST = 20
+KEEPALIVE_TIMEOUT_SECONDS = 60
+REQUEST_TIMEOUT_SECONDS = 120
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncClient:
+    loop = None
+    loop_thread = None
+    session = None
+    lock = threading.Lock()
+
+    @classmethod
+    def get_loop(cls):
+        with cls.lock:
+            if not cls.loop:
+                logger.debug('Starting async client event loop')
+                cls.loop = asyncio.new_event_loop()
+                cls.loop_thread = threading.Thread(target=cls.loop.run_forever, name='async-client', daemon=True)
+                cls.loop_thread.start()
+
+            return cls.loop
+
+    @classmethod
+    def run(cls, coroutine):
+        loop = cls.get_loop()
+        if threading.current_thread() is cls.loop_thread:
+            coroutine.close()
+            raise RuntimeError('AsyncClient.run can`t be called from the async client event loop, await instead')
+
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    @classmethod
+    async def get_session(cls):
+        if not cls.session or cls.session.closed:
+            # aiohttp takes a noticeable part of the startup time, so it is imported with the first request
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, limit_per_host=MAX_CONNECTIONS_PER_HOST,
+                                             keepalive_timeout=KEEPALIVE_TIMEOUT_SECONDS)
+            cls.session = aiohttp.ClientSession(connector=connector,
+                                                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS))
+
+        return cls.session
+
+    @classmethod
+    async def request(cls, method, url, **kwargs):
+        session = await cls.get_session()
+        async with session.request(method, url, **kwargs) as response:
+            content = await response.read()
+            if response.status >= 400:
+                raise HttpRequestError(method, url, response.status, content.decode('utf-8', errors='replace'))
+
+            return content
+
+    @classmethod
+    async def request_json(cls, method, url, **kwargs):
+        session = await cls.get_session()
+        async with session.request(method, url, **kwargs) as response:
+            if response.status >= 400:
+                raise HttpRequestError(method, url, response.status, await response.text(errors='replace'))
+
+            return await response.json(content_type=None)
+
+    @classmethod
+    async def close(cls):
+        if cls.session and not cls.session.closed:
+            await cls.session.close()
+
+
+class HttpRequestError(Exception):
+    def __init__(self, method, url, status, details):
+        self.status = status
+        message = f'{method} {url} failed with status {status}: {details[:500]}'
+        super().__init__(message)
@@ -0,0 +1,59 @@
+import logging
+import sqlite3
+import threading
+
+PATH_TO_CACHE_DATABASE = 'copy_maker/cache.sqlite3'
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStorage:
+    connection = None
+    lock = threading.RLock()
+    ready_schemas = set()
+
+    @classmethod
+    def get_connection(cls):
+        with cls.lock:
+            if not cls.connection:
+                logger.debug(f'Opening cache database {PATH_TO_CACHE_DATABASE}')
+                cls.connection = sqlite3.connect(PATH_TO_CACHE_DATABASE, check_same_thread=False,
+                                                 isolation_level=None)
+                cls.connection.execute('PRAGMA journal_mode=WAL')
+                cls.connection.execute('PRAGMA synchronous=NORMAL')
+
+            return cls.connection
+
+    @classmethod
+    def ensure_schema(cls, name, schema, on_create=None):
+        with cls.lock:
+            if name in cls.ready_schemas:
+                return
+
+            cls.get_connection().executescript(schema)
+            cls.ready_schemas.add(name)
+            if on_create:
+                on_create()
+
+    @classmethod
+    def fetch_one(cls, query, parameters=()):
+        with cls.lock:
+            return cls.get_connection().execute(query, parameters).fetchone()
+
+    @classmethod
+    def fetch_all(cls, query, parameters=()):
+        with cls.lock:
+            return cls.get_connection().execute(query, parameters).fetchall()
+
+    @classmethod
+    def execute(cls, query, parameters=()):
+        with cls.lock:
+            return cls.get_connection().execute(query, parameters).rowcount
+
+    @classmethod
+    def execute_many(cls, query, parameters_list):
+        with cls.lock:
+            connection = cls.get_connection()
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany(query, parameters_list)
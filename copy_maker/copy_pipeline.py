@@ -0,0 +1,219 @@
+import logging
+import re
+
+from .antispam import AntispamEngine
+from .styles_helper import A_TAG_PATTERN, TRACKING_LINK_PLACEHOLDER, StylesHelper
+from .templates import Template
+
+IMAGE_SRC_PATTERN = re.compile(r'src="[^"]*')
+
+logger = logging.getLogger(__name__)
+
+
+class CopyPipeline:
+    # A tag runs up to its > and everything between tags is text, entities stay inside the text they are in
+    tokenizer = re.compile(r'<[^>]*>?|[^<]+')
+
+    def __init__(self, styles_settings):
+        self.styles_settings = styles_settings
+        self.styles_helper = StylesHelper(styles_settings)
+        # The image block has no placeholders of its own, its urlhere is replaced along with the rest of the copy
+        self.image_block = Template(f'<!-- image-block-start -->{styles_settings['imageBlock']}<!-- image-block-end -->',
+                                    [], 'imageBlock').render({})
+
+    def run(self, copy):
+        collect_images, values, links_color = self.prepare(copy)
+        html = copy.lift_html
+
+        stages = self.make_stages(copy, collect_images, values, links_color)
+        parts = self.process_tokens(html, stages)
+
+        # Fallback styles are only used when their rule matched nothing, which is known once the whole copy was seen.
+        # They used to be applied before links and the tracking link, so the copy is processed again in that order
+        styles_stage = next((stage for stage in stages if isinstance(stage, StylesStage)), None)
+        if styles_stage and (fallbacks := styles_stage.get_fallbacks()):
+            logger.debug(f'Applying fallback styles: {", ".join(sorted(fallbacks))}')
+            stages = self.make_stages(copy, collect_images, values, links_color, fallbacks)
+            parts = self.process_tokens(html, stages)
+
+        copy.lift_html = ''.join(parts)
+        for stage in stages:
+            copy = stage.finish(copy)
+
+        return self.styles_helper.add_template(copy)
+
+    def process_tokens(self, html, stages):
+        # Stages only define the handlers they need, so every token goes through as few calls as possible
+        tag_handlers = [stage.process_tag for stage in stages if hasattr(stage, 'process_tag')]
+        text_handlers = [stage.process_text for stage in stages if hasattr(stage, 'process_text')]
+        # Whitespace between tags is the most common text, it is left as it is unless antispam replaces whitespace
+        skip_blank_text = not any(getattr(stage, 'changes_blank_text', False) for stage in stages)
+
+        parts = []
+        for token in self.tokenizer.findall(html):
+            if token[0] == '<':
+                for handler in tag_handlers:
+                    token = handler(token)
+            elif not (skip_blank_text and token.isspace()):
+                for handler in text_handlers:
+                    token = handler(token)
+
+            parts.append(token)
+
+        return parts
+
+    def prepare(self, copy):
+        collect_images = 'src="' in copy.lift_html
+        if not collect_images:
+            if copy.img_code:
+                logger.info('Copy has img code and doesnt contain images')
+                logger.debug(f'Adding image block to copy {copy.str_rep}')
+                copy.lift_html = copy.lift_html.replace('<br><br>', self.image_block, 1)
+            else:
+                logger.debug('No images no image code, doing nothing')
+
+        if self.styles_settings['antispam'] and copy.lift_sls:
+            antispam_engine = AntispamEngine.get(self.styles_settings['antispamReplacements'])
+            copy.lift_sls = antispam_engine.apply(copy.lift_sls)
+
+        # Values are picked in the same order as before: styles, then random-blue for links
+        values = self.styles_helper.choose_style_values()
+        links_color = self.styles_settings['linksColor'] if self.styles_settings[
+                                                                'linksColor'] != 'random-blue' else self.styles_helper.get_random_blue()
+
+        return collect_images, values, links_color
+
+    def make_stages(self, copy, collect_images, values, links_color, fallbacks=frozenset()):
+        stages = []
+
+        if collect_images:
+            stages.append(ImagesStage())
+
+        if self.styles_settings['antispam']:
+            stages.append(AntispamStage(AntispamEngine.get(self.styles_settings['antispamReplacements'])))
+
+        if self.styles_helper.rules:
+            stages.append(StylesStage(self.styles_helper, values, fallbacks))
+
+        add_es_button = self.styles_settings['addEsButton']
+        if links_color or add_es_button:
+            stages.append(LinksStage(links_color, self.styles_settings.get('buttonLinksColor'), add_es_button))
+
+        stages.append(PlaceholderStage(TRACKING_LINK_PLACEHOLDER, copy.tracking_link))
+
+        return stages
+
+
+class ImagesStage:
+    def __init__(self):
+        self.src_list = []
+
+    def process_tag(self, token):
+        if 'src="' in token:
+            self.src_list.extend(IMAGE_SRC_PATTERN.findall(token))
+
+        return token
+
+    def process_text(self, token):
+        return self.process_tag(token)
+
+    def finish(self, copy):
+        logger.info(f'Found {len(self.src_list)} images')
+        images_urls = []
+        for src_part in self.src_list:
+            img_url = src_part.split('"')[1]
+            if img_url not in images_urls:
+                images_urls.append(img_url)
+
+        copy.lift_images = images_urls
+        return copy
+
+
+class AntispamStage:
+    def __init__(self, antispam_engine):
+        self.antispam_engine = antispam_engine
+        self.changes_blank_text = any(char.isspace() for char, replacement in antispam_engine.replacements.items()
+                                      if len(char) == 1 and replacement)
+
+    def process_tag(self, token):
+        if self.antispam_engine.tag_table or '&' in token:
+            return self.antispam_engine.apply(token)
+
+        return token
+
+    def process_text(self, token):
+        if '&' in token:
+            return self.antispam_engine.apply(token)
+
+        return token.translate(self.antispam_engine.text_table)
+
+    def finish(self, copy):
+        return copy
+
+
+class StylesStage:
+    def __init__(self, styles_helper, values, fallbacks=frozenset()):
+        self.styles_helper = styles_helper
+        self.values = values
+        self.fallbacks = fallbacks
+        self.new_styles = styles_helper.make_new_styles(values)
+        self.replaced = set()
+
+        if styles_helper.can_combine(self.new_styles, values):
+            self.replace_styles = styles_helper.replace_styles
+        else:
+            self.replace_styles = styles_helper.replace_styles_one_by_one
+
+    def process_tag(self, token):
+        # Every rule pattern has a colon after the property name
+        if ':' in token:
+            token = self.replace_styles(token, self.new_styles, self.replaced)
+
+        if self.fallbacks:
+            token = self.styles_helper.replace_fallback_styles(token, self.values, self.fallbacks)
+
+        return token
+
+    def process_text(self, token):
+        return self.process_tag(token)
+
+    def get_fallbacks(self):
+        return self.styles_helper.get_fallbacks(self.replaced)
+
+    def finish(self, copy):
+        return copy
+
+
+class LinksStage:
+    def __init__(self, links_color, buttons_color, add_es_button):
+        self.links_color = links_color
+        self.buttons_color = buttons_color
+        self.add_es_button = add_es_button
+
+    def process_tag(self, token):
+        if '<a' not in token or not (match := A_TAG_PATTERN.search(token)):
+            return token
+
+        new_a_tag = StylesHelper.change_a_tag(match.group(1), self.links_color, self.buttons_color,
+                                              self.add_es_button)
+        self.add_es_button = False
+
+        return token[:match.start(1)] + new_a_tag + token[match.end(1):]
+
+    def finish(self, copy):
+        return copy
+
+
+class PlaceholderStage:
+    def __init__(self, placeholder, value):
+        self.placeholder = placeholder
+        self.value = value
+
+    def process_tag(self, token):
+        return token.replace(self.placeholder, self.value)
+
+    def process_text(self, token):
+        return token.replace(self.placeholder, self.value)
+
+    def finish(self, copy):
+        return copy
@@ -1,13 +1,16 @@
+import asyncio
 import dataclasses
 import logging
 import re
-
-from openpyxl.utils import get_column_letter
+import threading
 
 from . import google_services
 from . import secrets
+from .async_client import AsyncClient
+from .copy_pipeline import CopyPipeline
 from .crypto_all_products_types import crypto_all_products_types
 from .offer import Offer
+from .templates import Template
 
 logger = logging.getLogger(__name__)
 
@@ -36,36 +39,40 @@ class Domain:
         self.broadcast = settings_dict['broadcast']
         self.products = settings_dict['products']
         self.styles = settings_dict['styles']
+        self.copy_pipeline = CopyPipeline(self.styles)
+        self.tracking_link_template = Template(self.products['trackingLink']['template'],
+                                               ['[TRACKING_ID]', '[SEND_TYPE]', '[END]'], 'trackingLink template')
+        self.unsub_link_template = Template(self.products['priority']['unsubLinkTemplate'], ['[UNSUB_ID]'],
+                                            'unsubLinkTemplate')
 
     def get_copies_from_broadcast(self, date):
-        domain_index = google_services.GoogleSheets.get_table_index_of_value(self.broadcast['id'],
-                                                                             self.broadcast['name'],
-                                                                             f'{self.broadcast['page']}!1:1')
+        broadcast_grid = BroadcastGrid.get(self.broadcast['id'], self.broadcast['page'])
 
+        domain_index = broadcast_grid.get_domain_index(self.broadcast['name'])
         if not domain_index:
             logger.warning(f'Could not find domain {self.broadcast['name']} in Broadcast')
             return
 
-        date_index = google_services.GoogleSheets.get_table_index_of_value(self.broadcast['id'], date,
-                                                                           f'{self.broadcast['page']}!A:A', False)
-
-        if not date_index:
+        copies_for_domain = broadcast_grid.get_cell(date, domain_index)
+        if copies_for_domain is None:
             logger.warning(f'Could not find date {date} in Broadcast')
             return
 
-        date_row = date_index + 1
-        copies_range = f'{self.broadcast['page']}!{get_column_letter(domain_index + 1)}{date_row}'
-        copies_for_domain = google_services.GoogleSheets.get_data_from_range(self.broadcast['id'], copies_range)
         if not copies_for_domain:
-            logger.info(f'Could not find copies in range {copies_range} in Broadcast')
+            logger.info(f'Could not find copies for date {date} in Broadcast')
             return
 
-        copies_str = copies_for_domain[0][0].strip().split(' ')
+        copies_str = copies_for_domain.strip().split(' ')
         copies_str = list(map(lambda copy: copy.replace('(P)', ''), copies_str))
         copies_str = list(map(lambda copy: copy.replace('(L)', ''), copies_str))
 
         return copies_str
 
+    def get_copies_from_broadcast_for_dates(self, dates):
+        BroadcastGrid.get(self.broadcast['id'], self.broadcast['page']).load_dates(dates)
+
+        return {date: self.get_copies_from_broadcast(date) for date in dates}
+
     @staticmethod
     def create_copy(str_copy):
         pattern = r'^([A-Za-z]+)(\d+)(.*)$'
@@ -75,7 +82,37 @@ class Domain:
 
         return Copy(match.group(1), match.group(2), match.group(3), str_copy)
 
+    def prefetch_offers(self, offer_names):
+        google_services.DriveFolderIndex.ensure_built(self.products['partnersFolderId'])
+        google_services.DriveChangesSync.sync()
+        Offer.prefetch_offers(offer_names, self.products['mondayId'], self.products['partnersFolderId'],
+                              secrets.MONDAY_TOKEN)
+
+    def find_copies(self, copies):
+        return AsyncClient.run(self.find_copies_async(copies))
+
+    async def find_copies_async(self, copies):
+        # Drive requests of all copies share the client loop, the results keep the order of the copies
+        return await asyncio.gather(*(self.find_copy_async(copy) for copy in copies), return_exceptions=True)
+
     def find_copy(self, copy):
+        return AsyncClient.run(self.find_copy_async(copy))
+
+    async def find_copy_async(self, copy):
+        # Offer info and the priority footer come from the caches, Monday and Sheets through blocking calls
+        offer, offer_priority_info = await asyncio.to_thread(self.get_offer_info, copy)
+        lift_html, lift_sls = await offer.get_copy_files_content_async(copy.lift_number)
+
+        copy.offer_monday_fields = offer.fields
+        copy.priority_info = offer_priority_info
+        copy.lift_html = lift_html
+        if copy.lift_html:
+            copy.html_found = True
+        copy.lift_sls = lift_sls
+
+        return copy
+
+    def get_offer_info(self, copy):
         offer = Offer(copy.offer_name, self.products['mondayId'], self.products['partnersFolderId'],
                       secrets.MONDAY_TOKEN)
 
@@ -88,16 +125,7 @@ class Domain:
                                                                self.products['priority']['linkColumn'],
                                                                self.products['priority']['idColumn'])
 
-        lift_html, lift_sls = offer.get_copy_files_content(copy.lift_number)
-
-        copy.offer_monday_fields = offer.fields
-        copy.priority_info = offer_priority_info
-        copy.lift_html = lift_html
-        if copy.lift_html:
-            copy.html_found = True
-        copy.lift_sls = lift_sls
-
-        return copy
+        return offer, offer_priority_info
 
     def make_tracking_link(self, copy):
         tracking_id = copy.offer_monday_fields.get(self.products['trackingLink']['type'])
@@ -113,15 +141,12 @@ class Domain:
             case _:
                 link_end = copy.str_rep
 
-        link_body = self.products['trackingLink']['template']
-        tracking_link = link_body.replace('[TRACKING_ID]', tracking_id)
-
         send_type = self.get_send_type(copy)
-        tracking_link = tracking_link.replace('[SEND_TYPE]', send_type)
-
-        tracking_link = tracking_link.replace('[END]', link_end)
-
-        copy.tracking_link = tracking_link
+        copy.tracking_link = self.tracking_link_template.render({
+            '[TRACKING_ID]': tracking_id,
+            '[SEND_TYPE]': send_type,
+            '[END]': link_end,
+        })
 
         return copy
 
@@ -143,38 +168,70 @@ class Domain:
         if not copy.priority_info['unsub_id']:
             return copy
 
-        link_template = self.products['priority']['unsubLinkTemplate']
-        unsub_link = link_template.replace('[UNSUB_ID]', copy.priority_info['unsub_id'])
-        copy.priority_info['unsub_link'] = unsub_link
+        copy.priority_info['unsub_link'] = self.unsub_link_template.render({'[UNSUB_ID]': copy.priority_info['unsub_id']})
 
         return copy
 
-    def process_images(self, copy):
-        src_part_pattern = r'src="[^"]*'
-        images_urls = []
-        src_list = re.findall(src_part_pattern, copy.lift_html)
-        if len(src_list) == 0:
-            if copy.img_code:
-                logger.info('Copy has img code and doesnt contain images')
-                logger.debug(f'Adding image block to copy {copy.str_rep}')
-                copy.lift_html = copy.lift_html.replace('<br><br>',
-                                                        f'<!-- image-block-start -->{self.styles['imageBlock']}<!-- image-block-end -->',
-                                                        1)
-
-                return copy
-
-            else:
-                logger.debug('No images no image code, doing nothing')
-                return copy
-
-        logger.info(f'Found {len(src_list)} images')
-        for index, src_part in enumerate(src_list):
-            img_url = src_part.split('"')[1]
-            if img_url not in images_urls:
-                images_urls.append(img_url)
-
-        copy.lift_images = images_urls
-        return copy
+
+class BroadcastGrid:
+    grids = {}
+    lock = threading.Lock()
+
+    def __init__(self, spreadsheet_id, page):
+        self.spreadsheet_id = spreadsheet_id
+        self.page = page
+
+        logger.debug(f'Loading broadcast {spreadsheet_id} page {page}')
+        header_row, dates_column = google_services.GoogleSheets.batch_get(spreadsheet_id,
+                                                                         [f'{page}!1:1', f'{page}!A:A'],
+                                                                         use_cache=True)
+        self.header = header_row[0] if header_row else []
+        self.dates_rows = {}
+        for index, table_row in enumerate(dates_column):
+            date = table_row[0].strip() if table_row else None
+            if date and date not in self.dates_rows:
+                self.dates_rows[date] = index + 1
+
+        self.rows = {}
+        self.rows_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, spreadsheet_id, page):
+        with cls.lock:
+            if (spreadsheet_id, page) not in cls.grids:
+                cls.grids[(spreadsheet_id, page)] = cls(spreadsheet_id, page)
+
+            return cls.grids[(spreadsheet_id, page)]
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.grids = {}
+
+    def get_domain_index(self, domain_name):
+        return self.header.index(domain_name) if domain_name in self.header else None
+
+    def load_dates(self, dates):
+        with self.rows_lock:
+            rows_to_load = sorted({self.dates_rows[date] for date in dates
+                                   if date in self.dates_rows and self.dates_rows[date] not in self.rows})
+            if not rows_to_load:
+                return
+
+            logger.debug(f'Loading rows {rows_to_load} of broadcast {self.spreadsheet_id} page {self.page}')
+            rows_values = google_services.GoogleSheets.batch_get(self.spreadsheet_id,
+                                                                 [f'{self.page}!{row}:{row}' for row in rows_to_load])
+            for row, row_values in zip(rows_to_load, rows_values):
+                self.rows[row] = row_values[0] if row_values else []
+
+    def get_cell(self, date, column_index):
+        if date not in self.dates_rows:
+            return None
+
+        self.load_dates([date])
+        row_values = self.rows[self.dates_rows[date]]
+
+        return row_values[column_index] if column_index < len(row_values) else ''
 
 
 class DomainException(Exception):
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import threading
+import traceback
+
+DOMAINS_FOLDER = 'Domains/'
+DEFAULT_DOMAIN_NAME = 'DefaultDomain'
+DOMAIN_FILES = ('settings.json', 'template.html')
+
+logger = logging.getLogger(__name__)
+
+
+class DomainRegistry:
+    def __init__(self, domains_folder=DOMAINS_FOLDER):
+        self.domains_folder = domains_folder
+        # Domain name -> (files signature, Domain or None, parse error or None)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def names(self):
+        # Listing the folder is cheap, so domains added or removed by hand show up without a restart
+        return sorted(name for name in os.listdir(self.domains_folder)
+                      if name != DEFAULT_DOMAIN_NAME and os.path.isdir(self.get_path(name))
+                      and not self.get_error(name))
+
+    def get(self, name):
+        if name == DEFAULT_DOMAIN_NAME or not os.path.isdir(self.get_path(name)):
+            return None
+
+        signature = self.get_signature(name)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry and entry[0] == signature:
+                return entry[1]
+
+            if entry:
+                logger.info(f'Domain {name} changed, reloading')
+
+            domain, error = self.load(name)
+            self.entries[name] = signature, domain, error
+            return domain
+
+    def get_error(self, name):
+        # Only known while the files are the same as when they failed to parse
+        entry = self.entries.get(name)
+        if entry and entry[2] and entry[0] == self.get_signature(name):
+            return entry[2]
+
+        return None
+
+    def register(self, name):
+        with self.lock:
+            self.entries.pop(name, None)
+
+        return self.get(name)
+
+    def get_path(self, name):
+        return os.path.join(self.domains_folder, name)
+
+    def get_signature(self, name):
+        signature = []
+        for file_name in DOMAIN_FILES:
+            try:
+                stat = os.stat(os.path.join(self.get_path(name), file_name))
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+
+        return tuple(signature)
+
+    def load(self, name):
+        # Domain pulls in the google and styles modules, so it is only imported when a domain is actually used
+        from .domain import Domain
+
+        logger.debug(f'Parsing domain {name}')
+        full_path = self.get_path(name)
+        try:
+            domain_dict = json.load(open(full_path + '/settings.json'))
+            domain_dict['styles']['template'] = open(full_path + '/template.html').read()
+            return Domain(domain_dict), None
+        except Exception as e:
+            logger.error(f'Error parsing domain in folder "{name}": {e}')
+            logger.debug(traceback.format_exc())
+            return None, str(e)
@@ -1,28 +1,117 @@
+import asyncio
+import datetime
+import hashlib
 import json
 import logging
+import os
+import re
+import threading
+import time
 from io import BytesIO
+from urllib.parse import quote
 
-from docx import Document
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
+from . import cache_storage
+from .async_client import AsyncClient
 from . import secrets
+from .negative_cache import NegativeCache
+from .response_cache import ResponseCache
+
+GOOGLE_DRIVE_API_URL = 'https://www.googleapis.com/drive/v3'
+GOOGLE_SHEETS_API_URL = 'https://sheets.googleapis.com/v4'
+GOOGLE_SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets.readonly']
+CREDENTIALS_REFRESH_AHEAD_SECONDS = 10 * 60
+CREDENTIALS_REFRESH_COOLDOWN_SECONDS = 60
+DRIVE_INDEX_MAX_AGE_SECONDS = 60 * 60 * 24
+DRIVE_INDEX_PARENTS_PER_QUERY = 40
+PATH_TO_DRIVE_CONTENT_CACHE = 'copy_maker/drive_content_cache/'
+PATH_TO_SHEETS_CACHE = 'copy_maker/sheets_cache.json'
+SHEETS_CACHE_DURATION_SECONDS = 60 * 60
+SHEETS_CACHE_MAX_BYTES = 32 * 1024 * 1024
 
 logger = logging.getLogger(__name__)
 
 
-class ServicesHelper:
+class CredentialsManager:
+    credentials = None
+    lock = threading.Lock()
+    refresh_thread = None
+    last_refresh_attempt = 0
+
+    @classmethod
+    def get_credentials(cls):
+        credentials = cls.credentials
+        if not (credentials and credentials.valid):
+            # Refreshing the same credentials from two threads would spend the refresh token twice
+            cls.wait_for_background_refresh()
+            with cls.lock:
+                if not (cls.credentials and cls.credentials.valid):
+                    cls.credentials = cls.load_credentials(cls.credentials)
+
+                credentials = cls.credentials
+
+        if cls.expires_soon(credentials):
+            cls.start_background_refresh()
+
+        return credentials
 
     @staticmethod
-    def get_credentials():
-        creds = None
+    def expires_soon(credentials):
+        if not credentials.expiry:
+            return False
+
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - now < datetime.timedelta(seconds=CREDENTIALS_REFRESH_AHEAD_SECONDS)
+
+    @classmethod
+    def start_background_refresh(cls):
+        with cls.lock:
+            if cls.refresh_thread and cls.refresh_thread.is_alive():
+                return
 
-        scopes = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets.readonly']
+            if not (cls.credentials and cls.credentials.refresh_token):
+                return
+
+            # A failed refresh is not retried on every request, the current token stays usable until it expires
+            if time.monotonic() - cls.last_refresh_attempt < CREDENTIALS_REFRESH_COOLDOWN_SECONDS:
+                return
+
+            cls.last_refresh_attempt = time.monotonic()
+            cls.refresh_thread = threading.Thread(target=cls.refresh_in_background, args=(cls.credentials,),
+                                                  name='credentials-refresh', daemon=True)
+            cls.refresh_thread.start()
+
+    @classmethod
+    def wait_for_background_refresh(cls):
+        refresh_thread = cls.refresh_thread
+        if refresh_thread and refresh_thread.is_alive() and refresh_thread is not threading.current_thread():
+            logger.debug('Waiting for background refresh of Google credentials')
+            refresh_thread.join()
 
-        if secrets.CREDENTIALS:
-            creds = Credentials.from_authorized_user_info(secrets.CREDENTIALS, scopes)
+    @classmethod
+    def refresh_in_background(cls, credentials):
+        from google.auth.transport.requests import Request
+
+        logger.debug('Refreshing Google credentials ahead of expiry')
+        try:
+            # The current token stays valid until the new one replaces it
+            credentials.refresh(Request())
+        except Exception as e:
+            logger.warning(f'Failed to refresh Google credentials in background: {e}')
+            return
+
+        with cls.lock:
+            cls.save_credentials(credentials)
+
+    @classmethod
+    def load_credentials(cls, creds=None):
+        # google-auth pulls in requests and oauthlib, it is only imported once credentials are needed
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        if not creds and secrets.CREDENTIALS:
+            creds = Credentials.from_authorized_user_info(secrets.CREDENTIALS, GOOGLE_SCOPES)
 
         if creds:
             if creds.valid:
@@ -31,75 +120,179 @@ class ServicesHelper:
             elif creds.expired and creds.refresh_token:
                 creds.refresh(Request())
 
-                secrets.update_credentials(json.loads(creds.to_json()))
+                cls.save_credentials(creds)
                 return creds
 
-        flow = InstalledAppFlow.from_client_config(secrets.OAUTH_CLIENT, scopes)
+        flow = InstalledAppFlow.from_client_config(secrets.OAUTH_CLIENT, GOOGLE_SCOPES)
         creds = flow.run_local_server(port=0)
 
-        secrets.update_credentials(json.loads(creds.to_json()))
+        cls.save_credentials(creds)
 
         return creds
 
+    @staticmethod
+    def save_credentials(credentials):
+        secrets.update_credentials(json.loads(credentials.to_json()))
+
+
+class ServicesHelper:
+
+    @staticmethod
+    async def get_auth_headers():
+        credentials = CredentialsManager.credentials
+        if not (credentials and credentials.valid):
+            credentials = await asyncio.to_thread(CredentialsManager.get_credentials)
+        elif CredentialsManager.expires_soon(credentials):
+            CredentialsManager.start_background_refresh()
+
+        return {'Authorization': f'Bearer {credentials.token}'}
+
+    @classmethod
+    async def request(cls, url, params=None):
+        return await AsyncClient.request('GET', url, params=params, headers=await cls.get_auth_headers())
+
+    @classmethod
+    async def request_json(cls, url, params=None):
+        return await AsyncClient.request_json('GET', url, params=params, headers=await cls.get_auth_headers())
+
 
 class GoogleDrive:
-    drive_service = build('drive', 'v3', credentials=ServicesHelper.get_credentials(), cache_discovery=False)
+
+    @staticmethod
+    async def list_files_async(params):
+        return await ServicesHelper.request_json(f'{GOOGLE_DRIVE_API_URL}/files',
+                                                 {**params, 'includeItemsFromAllDrives': 'true',
+                                                  'supportsAllDrives': 'true'})
 
     @classmethod
     def execute_query(cls, query, fields='files(id, name)'):
-        result = cls.drive_service.files().list(q=query, fields=fields,
-                                                includeItemsFromAllDrives=True,
-                                                supportsAllDrives=True).execute()
+        return AsyncClient.run(cls.execute_query_async(query, fields))
+
+    @classmethod
+    async def execute_query_async(cls, query, fields='files(id, name)'):
+        result = await cls.list_files_async({'q': query, 'fields': fields})
         result = result.get('files', [])
 
         return result
 
+    @classmethod
+    def execute_paginated_query(cls, query, fields='nextPageToken, files(id, name)'):
+        return AsyncClient.run(cls.execute_paginated_query_async(query, fields))
+
+    @classmethod
+    async def execute_paginated_query_async(cls, query, fields='nextPageToken, files(id, name)'):
+        files, page_token = [], None
+        while True:
+            params = {'q': query, 'fields': fields, 'pageSize': 1000}
+            if page_token:
+                params['pageToken'] = page_token
+
+            result = await cls.list_files_async(params)
+            files.extend(result.get('files', []))
+
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return files
+
+    @classmethod
+    def get_children_folders(cls, parent_folder_ids):
+        return AsyncClient.run(cls.get_children_folders_async(parent_folder_ids))
+
+    @classmethod
+    async def get_children_folders_async(cls, parent_folder_ids):
+        queries = []
+        for batch_start in range(0, len(parent_folder_ids), DRIVE_INDEX_PARENTS_PER_QUERY):
+            batch = parent_folder_ids[batch_start:batch_start + DRIVE_INDEX_PARENTS_PER_QUERY]
+            parents_part = ' or '.join(f"'{parent_folder_id}' in parents" for parent_folder_id in batch)
+
+            query = f"mimeType='application/vnd.google-apps.folder' and trashed=false and ({parents_part})"
+            queries.append(cls.execute_paginated_query_async(query, 'nextPageToken, files(id, name, parents)'))
+
+        children_folders = {parent_folder_id: [] for parent_folder_id in parent_folder_ids}
+        for folders in await asyncio.gather(*queries):
+            for folder in folders:
+                for parent_folder_id in folder.get('parents', []):
+                    if parent_folder_id in children_folders:
+                        children_folders[parent_folder_id].append({'id': folder['id'], 'name': folder['name']})
+
+        return children_folders
+
     @classmethod
     def get_folder_by_name(cls, folder_name, parent_folder_id, strict=True):
+        return AsyncClient.run(cls.get_folder_by_name_async(folder_name, parent_folder_id, strict))
+
+    @classmethod
+    async def get_folder_by_name_async(cls, folder_name, parent_folder_id, strict=True):
+        # The folders index and the remembered misses live in the cache database, they are read off the event loop
+        if await asyncio.to_thread(DriveFolderIndex.is_listed, parent_folder_id):
+            if folder := await asyncio.to_thread(DriveFolderIndex.find_folder, folder_name, parent_folder_id, strict):
+                return folder
+
+        miss_key = f'{parent_folder_id}/{folder_name}' + ('' if strict else ' (contains)')
+        if await asyncio.to_thread(NegativeCache.contains, 'drive_folder', miss_key):
+            return None
+
         name_part = "name=" if strict else "name contains "
 
         query = f"{name_part}'{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false and '{parent_folder_id}' in parents"
-        folders = cls.execute_query(query)
-        if folders:
-            return folders[0]
-        else:
+        folders = await cls.execute_query_async(query)
+        if not folders:
             query = f"name='{folder_name} SA' and mimeType='application/vnd.google-apps.folder' and trashed=false and '{parent_folder_id}' in parents"
-            folders = cls.execute_query(query)
-            return folders[0] if folders else None
+            folders = await cls.execute_query_async(query)
+
+        if not folders:
+            await asyncio.to_thread(NegativeCache.add, 'drive_folder', miss_key)
+            return None
+
+        await asyncio.to_thread(DriveFolderIndex.add_folder, folders[0], parent_folder_id)
+        return folders[0]
 
     @classmethod
     def get_folders_of_folder(cls, parent_folder_id):
+        if DriveFolderIndex.is_listed(parent_folder_id):
+            return DriveFolderIndex.get_children(parent_folder_id)
+
         query = f"mimeType='application/vnd.google-apps.folder' and trashed=false and '{parent_folder_id}' in parents"
         folders = cls.execute_query(query)
         return folders
 
     @classmethod
     def get_files_from_folder(cls, folder_id):
+        return AsyncClient.run(cls.get_files_from_folder_async(folder_id))
+
+    @classmethod
+    async def get_files_from_folder_async(cls, folder_id):
         query = f'mimeType!="application/vnd.google-apps.folder" and trashed=false and "{folder_id}" in parents'
-        fields = 'files(id, name, mimeType)'
-        lift_folder_files = cls.execute_query(query, fields)
+        fields = 'files(id, name, mimeType, md5Checksum, modifiedTime, version)'
+        lift_folder_files = await cls.execute_query_async(query, fields)
 
         return lift_folder_files
 
     @classmethod
     def get_file_content(cls, file):
-        file_id = file['id']
+        return AsyncClient.run(cls.get_file_content_async(file))
+
+    @classmethod
+    async def get_file_content_async(cls, file):
+        file_url = f'{GOOGLE_DRIVE_API_URL}/files/{file['id']}'
         mime_type = file['mimeType']
         match mime_type:
             case 'text/html':
-                request = cls.drive_service.files().get_media(fileId=file_id)
-                content = request.execute().decode('utf-8')
+                content = (await cls.get_file_bytes_async(file, file_url, {'alt': 'media'})).decode('utf-8')
 
             case 'application/vnd.google-apps.document':
-                request = cls.drive_service.files().export_media(fileId=file_id,
-                                                                 mimeType='text/plain')
-
-                content = request.execute().decode('utf-8')
+                content = (await cls.get_file_bytes_async(file, file_url + '/export',
+                                                          {'mimeType': 'text/plain'})).decode('utf-8')
 
             case 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-                request = cls.drive_service.files().get_media(fileId=file_id)
+                cached_text = await asyncio.to_thread(DriveContentCache.read, file, 'txt')
+                if cached_text is not None:
+                    content = cached_text.decode('utf-8')
+                else:
+                    binary_data = await cls.get_file_bytes_async(file, file_url, {'alt': 'media'})
 
-                content = cls.extract_text_from_docx(request.execute())
+                    content = await asyncio.to_thread(cls.extract_text_from_docx, binary_data)
+                    await asyncio.to_thread(DriveContentCache.write, file, 'txt', content.encode('utf-8'))
 
             case _:
                 logger.warning(f'Unknown mime_type {mime_type}, returning None')
@@ -111,41 +304,439 @@ class GoogleDrive:
 
         return content
 
+    @staticmethod
+    async def get_file_bytes_async(file, url, params):
+        # The cache is on disk, reading and writing it stays off the event loop all requests share
+        content = await asyncio.to_thread(DriveContentCache.read, file, 'bin')
+        if content is not None:
+            logger.debug(f'Using cached content of file {file['name']}')
+            return content
+
+        content = await ServicesHelper.request(url, params)
+        await asyncio.to_thread(DriveContentCache.write, file, 'bin', content)
+
+        return content
+
     @staticmethod
     def extract_text_from_docx(binary_data):
+        from docx import Document
+
         doc_file = BytesIO(binary_data)
         doc = Document(doc_file)
         text = "\n".join([para.text for para in doc.paragraphs])
         return text
 
 
+class DriveContentCache:
+
+    @staticmethod
+    def get_path(file, extension):
+        revision = file.get('md5Checksum') or file.get('version') or file.get('modifiedTime')
+        if not revision:
+            return None
+
+        revision_hash = hashlib.sha1(str(revision).encode('utf-8')).hexdigest()[:16]
+        return PATH_TO_DRIVE_CONTENT_CACHE + f'{file['id']}-{revision_hash}.{extension}'
+
+    @classmethod
+    def read(cls, file, extension):
+        path = cls.get_path(file, extension)
+        if not path:
+            return None
+
+        try:
+            with open(path, 'rb') as cached_file:
+                return cached_file.read()
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def write(cls, file, extension, content):
+        path = cls.get_path(file, extension)
+        if not path:
+            return
+
+        os.makedirs(PATH_TO_DRIVE_CONTENT_CACHE, exist_ok=True)
+
+        temp_path = path + f'.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as cached_file:
+            cached_file.write(content)
+        os.replace(temp_path, path)
+
+        # Older revisions are removed only once the new one is in place, other threads may be writing it too
+        cls.discard(file['id'], extension, keep_path=path)
+
+    @staticmethod
+    def get_entries(file_id=None):
+        if not os.path.exists(PATH_TO_DRIVE_CONTENT_CACHE):
+            return []
+
+        with os.scandir(PATH_TO_DRIVE_CONTENT_CACHE) as entries:
+            return [entry for entry in entries
+                    if entry.is_file() and (not file_id or entry.name.startswith(f'{file_id}-'))]
+
+    @classmethod
+    def discard(cls, file_id, extension=None, keep_path=None):
+        for entry in cls.get_entries(file_id):
+            if entry.path == keep_path or entry.name.endswith('.tmp'):
+                continue
+
+            if not extension or entry.name.endswith(f'.{extension}'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def get_size(cls):
+        return sum(entry.stat().st_size for entry in cls.get_entries())
+
+    @classmethod
+    def clear(cls):
+        for entry in cls.get_entries():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+        logger.info('Google Drive files cache cleared')
+
+
+class DriveFolderIndex:
+    schema = '''
+        CREATE TABLE IF NOT EXISTS drive_folders (
+            parent_id TEXT NOT NULL,
+            id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (parent_id, id)
+        );
+        CREATE TABLE IF NOT EXISTS drive_folder_listings (
+            parent_id TEXT PRIMARY KEY,
+            root_id TEXT NOT NULL,
+            listing_timestamp REAL NOT NULL
+        );
+    '''
+
+    children = None
+    listings = None
+    lock = threading.RLock()
+
+    @classmethod
+    def load(cls):
+        with cls.lock:
+            if cls.children is not None:
+                return
+
+            cache_storage.CacheStorage.ensure_schema('drive_folders', cls.schema)
+            cls.children, cls.listings = {}, {}
+            for parent_id, root_id, listing_timestamp in cache_storage.CacheStorage.fetch_all(
+                    'SELECT parent_id, root_id, listing_timestamp FROM drive_folder_listings'):
+                cls.listings[parent_id] = (root_id, listing_timestamp)
+                cls.children[parent_id] = []
+
+            for parent_id, folder_id, name in cache_storage.CacheStorage.fetch_all(
+                    'SELECT parent_id, id, name FROM drive_folders ORDER BY parent_id, position'):
+                cls.children.setdefault(parent_id, []).append({'id': folder_id, 'name': name})
+
+            logger.debug(f'Loaded Google Drive folders index with {len(cls.listings)} listed folders')
+
+    @classmethod
+    def ensure_built(cls, root_folder_id):
+        cls.load()
+        with cls.lock:
+            listing = cls.listings.get(root_folder_id)
+            if listing and listing[1] + DRIVE_INDEX_MAX_AGE_SECONDS > time.time():
+                return
+
+            try:
+                cls.build(root_folder_id)
+            except Exception as e:
+                logger.warning(f'Could not build Google Drive folders index. Details : {e}')
+
+    @classmethod
+    def build(cls, root_folder_id):
+        logger.info('Building Google Drive folders index, it can take a while')
+
+        partners_folders = GoogleDrive.get_children_folders([root_folder_id])
+        offers_folders = GoogleDrive.get_children_folders(
+            [folder['id'] for folders in partners_folders.values() for folder in folders])
+        offers_subfolders = GoogleDrive.get_children_folders(
+            [folder['id'] for folders in offers_folders.values() for folder in folders])
+        lifts_folders = GoogleDrive.get_children_folders(
+            [folder['id'] for folders in offers_subfolders.values() for folder in folders
+             if 'html+sl' in folder['name'].lower()])
+
+        cls.set_listings(root_folder_id, {**partners_folders, **offers_folders, **offers_subfolders, **lifts_folders})
+
+    @classmethod
+    def set_listings(cls, root_folder_id, children_folders):
+        cls.load()
+        with cls.lock:
+            cls.delete_root(root_folder_id)
+
+            listing_timestamp = time.time()
+            for parent_id, folders in children_folders.items():
+                cls.children[parent_id] = folders
+                cls.listings[parent_id] = (root_folder_id, listing_timestamp)
+
+            cache_storage.CacheStorage.execute_many(
+                'INSERT OR REPLACE INTO drive_folder_listings (parent_id, root_id, listing_timestamp) VALUES (?, ?, ?)',
+                [(parent_id, root_folder_id, listing_timestamp) for parent_id in children_folders])
+            cache_storage.CacheStorage.execute_many(
+                'INSERT OR REPLACE INTO drive_folders (parent_id, id, name, position) VALUES (?, ?, ?, ?)',
+                [(parent_id, folder['id'], folder['name'], position)
+                 for parent_id, folders in children_folders.items() for position, folder in enumerate(folders)])
+
+            logger.info(f'Google Drive folders index built, {len(children_folders)} folders listed')
+
+    @classmethod
+    def delete_root(cls, root_folder_id):
+        parent_ids = [parent_id for parent_id, listing in cls.listings.items() if listing[0] == root_folder_id]
+        for parent_id in parent_ids:
+            del cls.listings[parent_id]
+            cls.children.pop(parent_id, None)
+
+        cache_storage.CacheStorage.execute_many('DELETE FROM drive_folders WHERE parent_id = ?',
+                                                [(parent_id,) for parent_id in parent_ids])
+        cache_storage.CacheStorage.execute('DELETE FROM drive_folder_listings WHERE root_id = ?', (root_folder_id,))
+
+    @classmethod
+    def is_listed(cls, parent_folder_id):
+        cls.load()
+        return parent_folder_id in cls.listings
+
+    @classmethod
+    def get_children(cls, parent_folder_id):
+        cls.load()
+        return list(cls.children.get(parent_folder_id, []))
+
+    @classmethod
+    def find_folder(cls, folder_name, parent_folder_id, strict=True):
+        children = cls.get_children(parent_folder_id)
+        if strict:
+            folders = [folder for folder in children if folder['name'] == folder_name]
+        else:
+            name_pattern = re.compile(r'(?<![0-9a-z])' + re.escape(folder_name.lower()))
+            folders = [folder for folder in children if name_pattern.search(folder['name'].lower())]
+
+        if not folders:
+            folders = [folder for folder in children if folder['name'] == f'{folder_name} SA']
+
+        return folders[0] if folders else None
+
+    @classmethod
+    def add_folder(cls, folder, parent_folder_id):
+        cls.load()
+        with cls.lock:
+            if parent_folder_id not in cls.listings:
+                return
+
+            children = cls.children.setdefault(parent_folder_id, [])
+            if any(child['id'] == folder['id'] for child in children):
+                return
+
+            children.append({'id': folder['id'], 'name': folder['name']})
+            cache_storage.CacheStorage.execute(
+                'INSERT OR REPLACE INTO drive_folders (parent_id, id, name, position) VALUES (?, ?, ?, ?)',
+                (parent_folder_id, folder['id'], folder['name'], len(children) - 1))
+
+    @classmethod
+    def apply_folder_change(cls, folder_id, folder=None):
+        cls.load()
+        with cls.lock:
+            changed_parent_ids = []
+            for parent_id, children in cls.children.items():
+                if any(child['id'] == folder_id for child in children):
+                    cls.children[parent_id] = [child for child in children if child['id'] != folder_id]
+                    changed_parent_ids.append(parent_id)
+
+            cache_storage.CacheStorage.execute('DELETE FROM drive_folders WHERE id = ?', (folder_id,))
+
+            if folder:
+                for parent_id in folder.get('parents', []):
+                    cls.add_folder(folder, parent_id)
+                    changed_parent_ids.append(parent_id)
+            else:
+                cls.listings.pop(folder_id, None)
+                cls.children.pop(folder_id, None)
+                cache_storage.CacheStorage.execute('DELETE FROM drive_folders WHERE parent_id = ?', (folder_id,))
+                cache_storage.CacheStorage.execute('DELETE FROM drive_folder_listings WHERE parent_id = ?',
+                                                   (folder_id,))
+
+            return changed_parent_ids
+
+    @classmethod
+    def get_size(cls):
+        cls.load()
+        return sum(len(folders) for folders in cls.children.values())
+
+    @classmethod
+    def clear(cls):
+        cls.load()
+        with cls.lock:
+            cls.children, cls.listings = {}, {}
+            cache_storage.CacheStorage.execute('DELETE FROM drive_folders')
+            cache_storage.CacheStorage.execute('DELETE FROM drive_folder_listings')
+            logger.info('Google Drive folders index cleared')
+
+
+class DriveChangesSync:
+    schema = '''
+        CREATE TABLE IF NOT EXISTS drive_sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    '''
+
+    api_url = None
+    lock = threading.Lock()
+    timer = None
+
+    @classmethod
+    def get_api_url(cls):
+        return cls.api_url or GOOGLE_DRIVE_API_URL
+
+    @classmethod
+    def get_page_token(cls):
+        cache_storage.CacheStorage.ensure_schema('drive_sync_state', cls.schema)
+        row = cache_storage.CacheStorage.fetch_one(
+            "SELECT value FROM drive_sync_state WHERE key = 'start_page_token'")
+
+        return row[0] if row else None
+
+    @classmethod
+    def set_page_token(cls, page_token):
+        cache_storage.CacheStorage.ensure_schema('drive_sync_state', cls.schema)
+        cache_storage.CacheStorage.execute(
+            "INSERT OR REPLACE INTO drive_sync_state (key, value) VALUES ('start_page_token', ?)", (page_token,))
+
+    @classmethod
+    def sync(cls):
+        with cls.lock:
+            try:
+                cls.apply_changes()
+            except Exception as e:
+                logger.warning(f'Could not sync Google Drive changes. Details : {e}')
+
+    @classmethod
+    def apply_changes(cls):
+        AsyncClient.run(cls.apply_changes_async())
+
+    @classmethod
+    async def apply_changes_async(cls):
+        changes_url = f'{cls.get_api_url()}/changes'
+
+        page_token = cls.get_page_token()
+        if not page_token:
+            result = await ServicesHelper.request_json(f'{changes_url}/startPageToken', {'supportsAllDrives': 'true'})
+            page_token = result['startPageToken']
+            logger.debug(f'Starting Google Drive changes sync from page token {page_token}')
+            cls.set_page_token(page_token)
+            return
+
+        applied_changes = 0
+        while page_token:
+            result = await ServicesHelper.request_json(changes_url, {
+                'pageToken': page_token, 'pageSize': 1000,
+                'fields': 'nextPageToken, newStartPageToken, changes(fileId, removed, '
+                          'file(id, name, mimeType, parents, trashed))',
+                'includeItemsFromAllDrives': 'true', 'supportsAllDrives': 'true'})
+
+            for change in result.get('changes', []):
+                await asyncio.to_thread(cls.apply_change, change)
+                applied_changes += 1
+
+            if new_start_page_token := result.get('newStartPageToken'):
+                cls.set_page_token(new_start_page_token)
+
+            page_token = result.get('nextPageToken')
+            if page_token:
+                cls.set_page_token(page_token)
+
+        logger.debug(f'Applied {applied_changes} Google Drive changes')
+
+    @classmethod
+    def apply_change(cls, change):
+        file = change.get('file')
+        removed = change.get('removed') or not file or file.get('trashed')
+
+        if file and file.get('mimeType') != 'application/vnd.google-apps.folder':
+            DriveContentCache.discard(change['fileId'])
+            return
+
+        changed_parent_ids = DriveFolderIndex.apply_folder_change(change['fileId'], None if removed else file)
+        for parent_id in changed_parent_ids:
+            NegativeCache.discard_prefix('drive_folder', f'{parent_id}/')
+
+    @classmethod
+    def start_background_sync(cls, interval_seconds):
+        def run():
+            cls.sync()
+            cls.start_background_sync(interval_seconds)
+
+        cls.timer = threading.Timer(interval_seconds, run)
+        cls.timer.daemon = True
+        cls.timer.start()
+
+
 class GoogleSheets:
-    sheet_service = build('sheets', 'v4', credentials=ServicesHelper.get_credentials(), cache_discovery=False)
-    cache = {}
+    cache = ResponseCache(SHEETS_CACHE_DURATION_SECONDS, SHEETS_CACHE_MAX_BYTES)
 
     @classmethod
     def get_new_data_from_range(cls, spreadsheet_id, range):
-        sheet = cls.sheet_service.spreadsheets()
+        return AsyncClient.run(cls.get_new_data_from_range_async(spreadsheet_id, range))
 
-        result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range).execute()
+    @staticmethod
+    async def get_new_data_from_range_async(spreadsheet_id, range):
+        result = await ServicesHelper.request_json(
+            f'{GOOGLE_SHEETS_API_URL}/spreadsheets/{spreadsheet_id}/values/{quote(range, safe='')}')
         values = result.get('values', [])
 
         return values
 
+    @classmethod
+    def batch_get(cls, spreadsheet_id, ranges, use_cache=False):
+        return AsyncClient.run(cls.batch_get_async(spreadsheet_id, ranges, use_cache))
+
+    @classmethod
+    async def batch_get_async(cls, spreadsheet_id, ranges, use_cache=False):
+        request = (spreadsheet_id, tuple(ranges))
+        if use_cache:
+            values = cls.cache.get(request)
+            if values:
+                return values
+
+        result = await ServicesHelper.request_json(
+            f'{GOOGLE_SHEETS_API_URL}/spreadsheets/{spreadsheet_id}/values:batchGet',
+            [('ranges', range) for range in ranges])
+        values = [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+
+        if use_cache:
+            cls.cache.set(request, values)
+
+        return values
+
     @classmethod
     def get_data_from_range(cls, spreadsheet_id, range, use_cache=False):
         request = (spreadsheet_id, range)
-
-        values = cls.cache.get(request)
-        if values and use_cache:
-            return values
+        if use_cache:
+            values = cls.cache.get(request)
+            if values:
+                return values
 
         values = cls.get_new_data_from_range(*request)
 
-        cls.cache[request] = values
+        if use_cache:
+            cls.cache.set(request, values)
 
         return values
 
+    @classmethod
+    def configure_cache(cls, duration_minutes, max_megabytes, persist):
+        cls.cache.configure(duration_minutes * 60, max_megabytes * 1024 * 1024,
+                            PATH_TO_SHEETS_CACHE if persist else None)
+
     @classmethod
     def get_table_index_of_value(cls, spreadsheet_id, value, range, is_row=True, strict=True):
         all_values = cls.get_data_from_range(spreadsheet_id, range, use_cache=True)
@@ -0,0 +1,415 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from urllib.parse import urlparse
+
+from . import cache_storage
+from .async_client import AsyncClient, HttpRequestError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PATH_TO_IMAGES = 'Images/'
+PATH_TO_IMAGES_STORE = 'Images/.store/'
+FICLONE = 0x40049409
+IMAGE_DOWNLOAD_CHUNK_SIZE = 256 * 1024
+IMAGE_DOWNLOADS_PER_HOST = 8
+IMAGE_SIGNATURE_LENGTH = 12
+IMAGES_MAX_WIDTH = 1100
+IMAGES_QUALITY = 85
+EXIF_ORIENTATION_TAG = 0x0112
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'\x00\x00\x01\x00', 'ico'),
+]
+
+logger = logging.getLogger(__name__)
+
+
+class ImageDownloader:
+    hosts_semaphores = {}
+    images_locks = {}
+
+    @classmethod
+    def save_images(cls, images):
+        if images:
+            AsyncClient.run(cls.save_images_async(images))
+
+    @classmethod
+    async def save_images_async(cls, images):
+        logger.debug(f'Saving {len(images)} images')
+        await asyncio.gather(*(cls.save_image_async(image_file_name, image_url, save_image_path)
+                               for image_file_name, image_url, save_image_path in images))
+
+    @classmethod
+    async def save_image_async(cls, image_file_name, image_url, save_image_path):
+        async with cls.images_locks.setdefault(image_file_name, asyncio.Lock()):
+            temp_full_image_path = PATH_TO_IMAGES + image_file_name + '.part'
+            try:
+                if await asyncio.to_thread(cls.place_saved_image, image_file_name, save_image_path):
+                    return
+
+                logger.debug(f'Saving {image_file_name} to {temp_full_image_path}')
+                try:
+                    ext, image_hash = await cls.download_async(image_url, temp_full_image_path)
+                except HttpRequestError as e:
+                    logger.warning(f'Error while saving image {image_file_name}. Request status code {e.status}')
+                    return
+
+                if not ext:
+                    ext = await asyncio.to_thread(cls.get_format_with_pillow, temp_full_image_path)
+
+                if ImageOptimizer.enabled:
+                    image_hash = await ImageOptimizer.optimize_async(temp_full_image_path, ext) or image_hash
+
+                await asyncio.to_thread(ImageStore.add, image_file_name, ext, image_hash, temp_full_image_path)
+                await asyncio.to_thread(ImageStore.place, image_file_name, save_image_path)
+
+            except Exception as e:
+                logger.error(f'Error while saving image {image_file_name}. Details : {e}')
+                logger.debug(traceback.format_exc())
+
+                if os.path.exists(temp_full_image_path):
+                    os.remove(temp_full_image_path)
+
+    @staticmethod
+    def place_saved_image(image_file_name, save_image_path):
+        os.makedirs(save_image_path, exist_ok=True)
+        if ImageStore.place(image_file_name, save_image_path):
+            return True
+
+        if ImageIndex.find(save_image_path, image_file_name):
+            logger.debug(f'Not saving {image_file_name} - image already saved')
+            return True
+
+        if saved_image_name := ImageIndex.find(PATH_TO_IMAGES, image_file_name):
+            logger.debug(f'Image {image_file_name} already downloaded, linking')
+            ImageStore.adopt(PATH_TO_IMAGES + saved_image_name)
+            ImageStore.link(PATH_TO_IMAGES + saved_image_name, save_image_path + saved_image_name)
+            return True
+
+        return False
+
+    @classmethod
+    async def download_async(cls, image_url, path):
+        host = urlparse(image_url).netloc
+        semaphore = cls.hosts_semaphores.setdefault(host, asyncio.Semaphore(IMAGE_DOWNLOADS_PER_HOST))
+
+        async with semaphore:
+            session = await AsyncClient.get_session()
+            async with session.get(image_url) as response:
+                if response.status >= 400:
+                    raise HttpRequestError('GET', image_url, response.status, await response.text(errors='replace'))
+
+                head, image_hash = b'', hashlib.sha256()
+                with open(path, 'wb') as file:
+                    async for chunk in response.content.iter_chunked(IMAGE_DOWNLOAD_CHUNK_SIZE):
+                        if len(head) < IMAGE_SIGNATURE_LENGTH:
+                            head += chunk[:IMAGE_SIGNATURE_LENGTH]
+                        image_hash.update(chunk)
+                        file.write(chunk)
+
+                return cls.get_format(head), image_hash.hexdigest()
+
+    @staticmethod
+    def get_format(head):
+        for signature, ext in IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                return ext
+
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'webp'
+
+        return None
+
+    @staticmethod
+    def get_format_with_pillow(path):
+        # Pillow is only needed for images with an unknown signature or when optimizing
+        from PIL import Image
+
+        with Image.open(path) as img:
+            return img.format.lower()
+
+
+class ImageOptimizer:
+    enabled = False
+    max_width = IMAGES_MAX_WIDTH
+    quality = IMAGES_QUALITY
+    executor = None
+    lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, enabled, max_width, quality):
+        cls.enabled = enabled
+        cls.max_width = max_width
+        cls.quality = quality
+
+    @classmethod
+    def get_executor(cls):
+        with cls.lock:
+            if not cls.executor:
+                cls.executor = ProcessPoolExecutor()
+
+            return cls.executor
+
+    @classmethod
+    async def optimize_async(cls, path, ext):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(cls.get_executor(), cls.optimize, path, ext,
+                                                                    cls.max_width, cls.quality)
+        except Exception as e:
+            logger.warning(f'Could not optimize image {path}. Details : {e}')
+
+    @staticmethod
+    def optimize(path, ext, max_width, quality):
+        if ext not in ('jpeg', 'png', 'webp'):
+            return None
+
+        from PIL import Image, ImageOps
+
+        with Image.open(path) as img:
+            if getattr(img, 'is_animated', False):
+                return None
+
+            # The optimized file carries no EXIF, so the orientation is applied to the pixels instead
+            icc_profile = img.info.get('icc_profile')
+            transposed = img.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+            img = ImageOps.exif_transpose(img)
+
+            resized = img.width > max_width
+            if resized:
+                img = img.resize((max_width, round(img.height * max_width / img.width)), Image.Resampling.LANCZOS)
+
+            optimized_image = BytesIO()
+            match ext:
+                case 'jpeg':
+                    img = img if img.mode in ('RGB', 'L', 'CMYK') else img.convert('RGB')
+                    img.save(optimized_image, 'JPEG', quality=quality, optimize=True, progressive=True,
+                             icc_profile=icc_profile)
+                case 'png':
+                    img.save(optimized_image, 'PNG', optimize=True, icc_profile=icc_profile)
+                case 'webp':
+                    img.save(optimized_image, 'WEBP', quality=quality, method=6, icc_profile=icc_profile)
+
+        optimized_content = optimized_image.getvalue()
+        if not resized and not transposed and len(optimized_content) >= os.path.getsize(path):
+            return None
+
+        with open(path, 'wb') as file:
+            file.write(optimized_content)
+
+        return hashlib.sha256(optimized_content).hexdigest()
+
+
+class ImageStore:
+    schema = '''
+        CREATE TABLE IF NOT EXISTS images_manifest (
+            name TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            ext TEXT NOT NULL
+        );
+    '''
+
+    lock = threading.Lock()
+
+    @classmethod
+    def prepare_storage(cls):
+        cache_storage.CacheStorage.ensure_schema('images_manifest', cls.schema)
+
+    @staticmethod
+    def get_blob_path(image_hash, ext):
+        return PATH_TO_IMAGES_STORE + f'{image_hash[:2]}/{image_hash}.{ext}'
+
+    @classmethod
+    def get(cls, image_file_name):
+        cls.prepare_storage()
+        row = cache_storage.CacheStorage.fetch_one('SELECT hash, ext FROM images_manifest WHERE name = ?',
+                                                   (image_file_name,))
+        if not row:
+            return None
+
+        image_hash, ext = row
+        blob_path = cls.get_blob_path(image_hash, ext)
+        if not os.path.exists(blob_path):
+            logger.debug(f'Stored image {image_file_name} is missing, forgetting it')
+            cache_storage.CacheStorage.execute('DELETE FROM images_manifest WHERE name = ?', (image_file_name,))
+            return None
+
+        return blob_path, ext
+
+    @classmethod
+    def add(cls, image_file_name, ext, image_hash, path):
+        blob_path = cls.get_blob_path(image_hash, ext)
+        with cls.lock:
+            if os.path.exists(blob_path):
+                logger.debug(f'Image {image_file_name} is already stored as {image_hash}')
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(path, blob_path)
+
+        cls.prepare_storage()
+        cache_storage.CacheStorage.execute('INSERT OR REPLACE INTO images_manifest (name, hash, ext) VALUES (?, ?, ?)',
+                                           (image_file_name, image_hash, ext))
+        cls.link(blob_path, PATH_TO_IMAGES + f'{image_file_name}.{ext}')
+
+    @classmethod
+    def adopt(cls, path):
+        image_file_name, ext = os.path.splitext(os.path.basename(path))
+        if not ext or cls.get(image_file_name):
+            return
+
+        image_hash = hashlib.sha256()
+        with open(path, 'rb') as file:
+            while chunk := file.read(IMAGE_DOWNLOAD_CHUNK_SIZE):
+                image_hash.update(chunk)
+
+        blob_path = cls.get_blob_path(image_hash.hexdigest(), ext[1:])
+        with cls.lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                cls.link(path, blob_path)
+
+        cache_storage.CacheStorage.execute('INSERT OR REPLACE INTO images_manifest (name, hash, ext) VALUES (?, ?, ?)',
+                                           (image_file_name, image_hash.hexdigest(), ext[1:]))
+
+    @classmethod
+    def place(cls, image_file_name, save_image_path):
+        stored_image = cls.get(image_file_name)
+        if not stored_image:
+            return False
+
+        blob_path, ext = stored_image
+        if ImageIndex.contains(save_image_path, f'{image_file_name}.{ext}'):
+            logger.debug(f'Not saving {image_file_name} - image already saved')
+        else:
+            logger.debug(f'Image {image_file_name} already downloaded, linking')
+            cls.link(blob_path, save_image_path + f'{image_file_name}.{ext}')
+
+        return True
+
+    @classmethod
+    def link(cls, source_path, target_path):
+        if not os.path.exists(target_path):
+            cls.link_file(source_path, target_path)
+
+        ImageIndex.add(os.path.dirname(target_path), os.path.basename(target_path))
+
+    @staticmethod
+    def link_file(source_path, target_path):
+        try:
+            os.link(source_path, target_path)
+            return
+        except OSError:
+            pass
+
+        if fcntl:
+            try:
+                with open(source_path, 'rb') as source_file, open(target_path, 'wb') as target_file:
+                    fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+                return
+            except OSError:
+                os.remove(target_path)
+
+        shutil.copy(source_path, target_path)
+
+    @classmethod
+    def get_size(cls):
+        cls.prepare_storage()
+        images_count = cache_storage.CacheStorage.fetch_one('SELECT COUNT(*) FROM images_manifest')[0]
+
+        blobs_size = 0
+        if os.path.exists(PATH_TO_IMAGES_STORE):
+            for directory_path, _, file_names in os.walk(PATH_TO_IMAGES_STORE):
+                blobs_size += sum(os.path.getsize(os.path.join(directory_path, file_name)) for file_name in file_names)
+
+        return images_count, blobs_size
+
+
+class ImageIndex:
+    folders = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def get_key(folder_path):
+        return os.path.normpath(folder_path)
+
+    @classmethod
+    def get_folder(cls, folder_path):
+        key = cls.get_key(folder_path)
+        try:
+            modification_time = os.stat(key).st_mtime_ns
+        except FileNotFoundError:
+            modification_time = None
+
+        with cls.lock:
+            folder = cls.folders.get(key)
+            if folder and folder[0] == modification_time:
+                return folder
+
+            names = []
+            if modification_time is not None:
+                with os.scandir(key) as entries:
+                    names = sorted(entry.name for entry in entries
+                                   if entry.is_file() and not entry.name.endswith('.part'))
+
+            logger.debug(f'Indexed {len(names)} images in {key}')
+            folder = cls.folders[key] = (modification_time, names, set(names))
+            return folder
+
+    @classmethod
+    def contains(cls, folder_path, file_name):
+        return file_name in cls.get_folder(folder_path)[2]
+
+    @classmethod
+    def find(cls, folder_path, image_file_name):
+        modification_time, names, names_set = cls.get_folder(folder_path)
+        if image_file_name in names_set:
+            return image_file_name
+
+        name_prefix = image_file_name + '.'
+        index = bisect.bisect_left(names, name_prefix)
+        if index < len(names) and names[index].startswith(name_prefix):
+            return names[index]
+
+        return None
+
+    @classmethod
+    def find_prefix(cls, folder_path, name_prefix):
+        # Custom images are matched by the start of their name, like ABC_1a-banner.png or ABC_1a (2).jpg
+        modification_time, names, names_set = cls.get_folder(folder_path)
+        index = bisect.bisect_left(names, name_prefix)
+        if index < len(names) and names[index].startswith(name_prefix):
+            return names[index]
+
+        return None
+
+    @classmethod
+    def add(cls, folder_path, file_name):
+        key = cls.get_key(folder_path)
+        with cls.lock:
+            folder = cls.folders.get(key)
+            if not folder:
+                return
+
+            modification_time, names, names_set = folder
+            if file_name not in names_set:
+                bisect.insort(names, file_name)
+                names_set.add(file_name)
+
+            cls.folders[key] = (os.stat(key).st_mtime_ns, names, names_set)
@@ -0,0 +1,69 @@
+import logging
+import time
+
+from . import cache_storage
+
+NEGATIVE_CACHE_DURATION_SECONDS = 60 * 15
+
+logger = logging.getLogger(__name__)
+
+
+class NegativeCache:
+    schema = '''
+        CREATE TABLE IF NOT EXISTS negative_results (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            creation_timestamp REAL NOT NULL,
+            PRIMARY KEY (kind, key)
+        );
+        CREATE INDEX IF NOT EXISTS negative_results_creation_timestamp ON negative_results (creation_timestamp);
+    '''
+
+    @classmethod
+    def prepare_storage(cls):
+        cache_storage.CacheStorage.ensure_schema('negative_results', cls.schema, cls.delete_expired)
+
+    @classmethod
+    def contains(cls, kind, key):
+        cls.prepare_storage()
+        row = cache_storage.CacheStorage.fetch_one(
+            'SELECT creation_timestamp FROM negative_results WHERE kind = ? AND key = ?', (kind, key))
+
+        if row and row[0] + NEGATIVE_CACHE_DURATION_SECONDS > time.time():
+            logger.debug(f'Found remembered miss {kind} for {key}')
+            return True
+
+        return False
+
+    @classmethod
+    def add(cls, kind, key):
+        cls.prepare_storage()
+        logger.debug(f'Remembering miss {kind} for {key}')
+        cache_storage.CacheStorage.execute(
+            'INSERT OR REPLACE INTO negative_results (kind, key, creation_timestamp) VALUES (?, ?, ?)',
+            (kind, key, time.time()))
+
+    @classmethod
+    def discard_prefix(cls, kind, key_prefix):
+        cls.prepare_storage()
+        cache_storage.CacheStorage.execute(
+            'DELETE FROM negative_results WHERE kind = ? AND substr(key, 1, ?) = ?',
+            (kind, len(key_prefix), key_prefix))
+
+    @classmethod
+    def get_entries(cls):
+        cls.prepare_storage()
+        return cache_storage.CacheStorage.fetch_all(
+            'SELECT kind, key, creation_timestamp FROM negative_results WHERE creation_timestamp > ? '
+            'ORDER BY creation_timestamp', (time.time() - NEGATIVE_CACHE_DURATION_SECONDS,))
+
+    @classmethod
+    def delete_expired(cls):
+        cache_storage.CacheStorage.execute('DELETE FROM negative_results WHERE creation_timestamp < ?',
+                                           (time.time() - NEGATIVE_CACHE_DURATION_SECONDS,))
+
+    @classmethod
+    def clear(cls):
+        cls.prepare_storage()
+        cache_storage.CacheStorage.execute('DELETE FROM negative_results')
+        logger.info('Remembered misses successfully cleared')
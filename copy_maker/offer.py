@@ -1,55 +1,135 @@
+import asyncio
 import json
 import logging
+import os
+import threading
 import time
 
-import requests
-
+from . import cache_storage
 from . import google_services
+from .async_client import AsyncClient
+from .negative_cache import NegativeCache
 
 MAX_CACHE_DURATION_SECONDS = 60 * 60 * 6
+MAX_STALE_CACHE_DURATION_SECONDS = 60 * 60 * 24
 PATH_TO_FILE_OFFERS_CACHE = 'copy_maker/offers_info_cache.json'
 
+MONDAY_API_URL = 'https://api.monday.com/v2'
+MONDAY_PREFETCH_BATCH_SIZE = 20
+
+WRONG_OFFERS = {
+    "AHMS": 8753642885,
+    "AHTT": 8753520275,
+    "CONO": 7101745053,
+    "AHTG": 8721191855,
+    "BIGG": 7654340357,
+    "IAL": 1056026291
+}
+
 logger = logging.getLogger(__name__)
 
 
 class OffersCache:
+    stale_while_revalidate = False
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS offers_info (
+            name TEXT PRIMARY KEY,
+            info TEXT NOT NULL,
+            creation_timestamp REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS offers_info_creation_timestamp ON offers_info (creation_timestamp);
+    '''
 
     @classmethod
-    def get_cache(cls):
-        logger.debug('Getting all offers info cache')
-        offers_info_cache = cls.read_json_file(PATH_TO_FILE_OFFERS_CACHE)
+    def prepare_storage(cls):
+        cache_storage.CacheStorage.ensure_schema('offers_info', cls.schema, cls.on_storage_created)
 
-        return offers_info_cache
+    @classmethod
+    def on_storage_created(cls):
+        cls.migrate_json_cache()
+        cls.delete_expired(max(MAX_CACHE_DURATION_SECONDS, MAX_STALE_CACHE_DURATION_SECONDS))
 
     @classmethod
-    def set_cache(cls, new_offers_info_cache):
-        logger.debug('Setting new offers info cache')
-        cls.write_json_file(PATH_TO_FILE_OFFERS_CACHE, new_offers_info_cache)
+    def migrate_json_cache(cls):
+        if not os.path.exists(PATH_TO_FILE_OFFERS_CACHE):
+            return
+
+        logger.info('Migrating offers info cache from json file')
+        try:
+            offers_info_cache = cls.read_json_file(PATH_TO_FILE_OFFERS_CACHE)
+            cls.set_offers_cache(offers_info_cache.values())
+        except Exception as e:
+            logger.warning(f'Could not migrate offers info cache from json file. Details : {e}')
+            return
+
+        os.replace(PATH_TO_FILE_OFFERS_CACHE, PATH_TO_FILE_OFFERS_CACHE + '.migrated')
 
     @classmethod
-    def set_offer_cache(cls, offer_info):
+    def get_offer_cache(cls, offer_name):
+        cls.prepare_storage()
+        logger.debug(f'Getting offer {offer_name} info cache')
+        row = cache_storage.CacheStorage.fetch_one('SELECT info FROM offers_info WHERE name = ?', (offer_name,))
 
-        offers_info_cache = cls.get_cache()
-        offers_info_cache[offer_info['name']] = offer_info
+        return json.loads(row[0]) if row else None
 
-        cls.set_cache(offers_info_cache)
+    @classmethod
+    def set_offer_cache(cls, offer_info):
+        cls.set_offers_cache([offer_info])
 
         return offer_info
 
+    @classmethod
+    def set_offers_cache(cls, offers_info):
+        cls.prepare_storage()
+        rows = [(offer_info['name'], json.dumps(offer_info), offer_info['creation_timestamp'])
+                for offer_info in offers_info]
+        logger.debug(f'Setting offers info cache for {", ".join(row[0] for row in rows)}')
+
+        cache_storage.CacheStorage.execute_many(
+            'INSERT INTO offers_info (name, info, creation_timestamp) VALUES (?, ?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET info = excluded.info, creation_timestamp = excluded.creation_timestamp',
+            rows)
+
+    @staticmethod
+    def is_valid(offer_cached_info):
+        return bool(offer_cached_info) and (
+                offer_cached_info['creation_timestamp'] + MAX_CACHE_DURATION_SECONDS > time.time())
+
+    @classmethod
+    def is_usable_stale(cls, offer_cached_info):
+        return cls.stale_while_revalidate and bool(offer_cached_info) and (
+                offer_cached_info['creation_timestamp'] + MAX_STALE_CACHE_DURATION_SECONDS > time.time())
+
+    @classmethod
+    def update_offer_cache(cls, offer_name, key, new_value):
+        offer_info = cls.get_offer_cache(offer_name)
+        if not offer_info:
+            logger.warning(f'Can`t update cache of {offer_name} as it is NOT found in cache')
+            return
+
+        offer_info[key] = new_value
+        cls.set_offer_cache(offer_info)
+
+    @classmethod
+    def delete_expired(cls, max_age_seconds):
+        deleted = cache_storage.CacheStorage.execute('DELETE FROM offers_info WHERE creation_timestamp < ?',
+                                                     (time.time() - max_age_seconds,))
+        if deleted:
+            logger.debug(f'Deleted {deleted} expired offers info cache entries')
+
     @classmethod
     def clear_cache(cls, option):
+        cls.prepare_storage()
         match option:
             case 'all':
-                cls.set_cache({})
+                cache_storage.CacheStorage.execute('DELETE FROM offers_info')
                 logger.info('All cache successfully cleared')
             case _:
-                all_cache = cls.get_cache()
-                if not all_cache.get(option):
+                if not cache_storage.CacheStorage.execute('DELETE FROM offers_info WHERE name = ?', (option,)):
                     logger.warning(f'Can`t clear cache of {option} as it is NOT found in cache')
                     return
 
-                del all_cache[option]
-                cls.set_cache(all_cache)
                 logger.info(f'Cache for offer {option} cleared')
 
     @staticmethod
@@ -58,12 +138,6 @@ class OffersCache:
         with open(path, 'r', encoding="utf-8") as file:
             return json.load(file)
 
-    @staticmethod
-    def write_json_file(path, data):
-        logger.debug(f'Writing to {path}')
-        with open(path, 'w') as file:
-            json.dump(data, file, indent=4)
-
 
 # class OffersCache:
 #     DATABASE_CREDENTIALS = json.load(open('../SystemData/secrets.json'))['DATABASE_CREDENTIALS']
@@ -90,16 +164,19 @@ class OffersCache:
 
 
 class Offer:
-    def __init__(self, offer_name, board_id=None, partners_folder_id=None, monday_token=None):
+    refreshing_offers = set()
+    refreshing_lock = threading.Lock()
+
+    def __init__(self, offer_name, board_id=None, partners_folder_id=None, monday_token=None, fields=None):
         self.name = offer_name
-        self.fields = self.find_offer_info(board_id, partners_folder_id, monday_token)
+        self.fields = fields or self.find_offer_info(board_id, partners_folder_id, monday_token)
 
     def find_offer_info(self, board_id, partners_folder_id, monday_token):
         # offer_cached_info = OffersCache.get_cached_offer(self.name)
         # if offer_cached_info:
 
-        offer_cached_info = OffersCache.get_cache().get(self.name)
-        if offer_cached_info and (offer_cached_info['creation_timestamp'] + MAX_CACHE_DURATION_SECONDS > time.time()):
+        offer_cached_info = OffersCache.get_offer_cache(self.name)
+        if OffersCache.is_valid(offer_cached_info):
             logger.debug(f'Found valid cache for {self.name}')
             return offer_cached_info
 
@@ -107,7 +184,18 @@ class Offer:
             logger.error('Offer was not found in cache and no board id or partners_folder_id was provided')
             raise OfferNotFound(self.name)
 
+        if NegativeCache.contains('monday_offer', f'{board_id}/{self.name}'):
+            raise OfferNotFound(self.name)
+
+        if OffersCache.is_usable_stale(offer_cached_info):
+            logger.debug(f'Using stale cache for {self.name}, refreshing it in background')
+            self.refresh_in_background(board_id, partners_folder_id, monday_token)
+            return offer_cached_info
+
         logger.debug(f'Offer {self.name} was not found in cache')
+        return self.get_new_offer_info(board_id, partners_folder_id, monday_token)
+
+    def get_new_offer_info(self, board_id, partners_folder_id, monday_token):
         logger.debug(f'Getting new info to cache for offer {self.name}')
         raw_offer_monday_fields = self._get_raw_offer_info(board_id, monday_token)
         offer_info = self._process_raw_offer_info(raw_offer_monday_fields, partners_folder_id)
@@ -116,89 +204,173 @@ class Offer:
 
         return offer_info
 
+    def refresh_in_background(self, board_id, partners_folder_id, monday_token):
+        with self.refreshing_lock:
+            if self.name in self.refreshing_offers:
+                logger.debug(f'Offer {self.name} is already refreshing')
+                return
+
+            self.refreshing_offers.add(self.name)
+
+        threading.Thread(target=self._refresh, args=(board_id, partners_folder_id, monday_token),
+                         name=f'refresh-{self.name}', daemon=True).start()
+
+    def _refresh(self, board_id, partners_folder_id, monday_token):
+        try:
+            self.get_new_offer_info(board_id, partners_folder_id, monday_token)
+            logger.debug(f'Refreshed cache for {self.name} in background')
+        except Exception as e:
+            logger.warning(f'Could not refresh cache for {self.name} in background. Details : {e}')
+        finally:
+            with self.refreshing_lock:
+                self.refreshing_offers.discard(self.name)
+
+    @classmethod
+    def prefetch_offers(cls, offer_names, board_id, partners_folder_id, monday_token):
+        offer_names_to_fetch = []
+        for offer_name in dict.fromkeys(offer_names):
+            if NegativeCache.contains('monday_offer', f'{board_id}/{offer_name}'):
+                continue
+
+            offer_cached_info = OffersCache.get_offer_cache(offer_name)
+            if not (OffersCache.is_valid(offer_cached_info) or OffersCache.is_usable_stale(offer_cached_info)):
+                offer_names_to_fetch.append(offer_name)
+
+        if not offer_names_to_fetch:
+            logger.debug('All offers are already cached, nothing to prefetch')
+            return
+
+        logger.info(f'Prefetching info for offers: {", ".join(offer_names_to_fetch)}')
+        batches = [offer_names_to_fetch[batch_start:batch_start + MONDAY_PREFETCH_BATCH_SIZE]
+                   for batch_start in range(0, len(offer_names_to_fetch), MONDAY_PREFETCH_BATCH_SIZE)]
+        batches_raw_offers_monday_fields = AsyncClient.run(cls._gather_raw_offers_info(batches, board_id, monday_token))
+
+        offers_info = []
+        for batch, raw_offers_monday_fields in zip(batches, batches_raw_offers_monday_fields):
+            for offer_name in batch:
+                raw_offer_monday_fields = raw_offers_monday_fields.get(offer_name)
+                if not raw_offer_monday_fields:
+                    logger.warning(f'Offer {offer_name} was not found in Monday while prefetching')
+                    continue
+
+                try:
+                    offer = cls(offer_name, fields=raw_offer_monday_fields)
+                    offers_info.append(offer._process_raw_offer_info(raw_offer_monday_fields, partners_folder_id))
+                except Exception as e:
+                    logger.warning(f'Could not prefetch offer {offer_name}. Details : {e}')
+
+        if offers_info:
+            OffersCache.set_offers_cache(offers_info)
+
     def _get_raw_offer_info(self, board_id, monday_token):
         logger.info(f'Getting raw info for {self.name} from backend')
 
-        WRONG_OFFERS = {
-            "AHMS": 8753642885,
-            "AHTT": 8753520275,
-            "CONO": 7101745053,
-            "AHTG": 8721191855,
-            "BIGG": 7654340357,
-            "IAL": 1056026291
-        }
+        return self._get_raw_offers_info([self.name], board_id, monday_token).get(self.name)
 
-        item_id = WRONG_OFFERS.get(self.name)
+    @classmethod
+    async def _gather_raw_offers_info(cls, batches, board_id, monday_token):
+        return await asyncio.gather(*(cls._get_raw_offers_info_async(batch, board_id, monday_token)
+                                      for batch in batches))
 
-        if item_id:
-            query = '''
-                    query ($value: ID!) {
-                      items(ids: [$value]) {
-                        id
-                        name
-                        column_values {
-                          id
-                          value
-                          type
-                          text
-                          column {
-                            title
-                          }
-                        }
-                      }
-                    }
-                    '''
+    @classmethod
+    def _get_raw_offers_info(cls, offer_names, board_id, monday_token):
+        return AsyncClient.run(cls._get_raw_offers_info_async(offer_names, board_id, monday_token))
 
-            variables = {
-                "value": item_id,
-            }
-        else:
-            query = """
-                query ($boardId: ID!, $value: CompareValue!) {
-                  boards(ids: [$boardId]) {
-                    items_page(query_params: {rules: [{column_id: "name", compare_value: $value, operator: contains_text}]}) {
-                      items {
-                        id
-                        name
-                        column_values {
+    @classmethod
+    async def _get_raw_offers_info_async(cls, offer_names, board_id, monday_token):
+        item_fields = '''
                           id
-                          text
-                          column {
-                            title
+                          name
+                          column_values {
+                            id
+                            text
+                            column {
+                              title
+                            }
                           }
-                        }
-                      }
-                    }
-                  }
-                }
-                """
-
-            variables = {
-                "boardId": board_id,
-                "value": self.name,
-            }
+        '''
+
+        item_ids, rule_queries, variables_definitions, variables = [], [], [], {}
+        for index, offer_name in enumerate(offer_names):
+            if item_id := WRONG_OFFERS.get(offer_name):
+                item_ids.append(item_id)
+                continue
+
+            variables_definitions.append(f'$value{index}: CompareValue!')
+            variables[f'value{index}'] = offer_name
+            rule_queries.append(f'''
+                    offer{index}: items_page(query_params: {{rules: [{{column_id: "name", compare_value: $value{index}, operator: contains_text}}]}}) {{
+                      items {{{item_fields}}}
+                    }}''')
+
+        query_parts = []
+        if rule_queries:
+            variables_definitions.insert(0, '$boardId: ID!')
+            variables['boardId'] = board_id
+            query_parts.append(f'''
+                  boards(ids: [$boardId]) {{
+                    {''.join(rule_queries)}
+                  }}''')
+
+        if item_ids:
+            variables_definitions.append('$itemIds: [ID!]')
+            variables['itemIds'] = item_ids
+            query_parts.append(f'''
+                  items(ids: $itemIds) {{{item_fields}}}''')
+
+        query = f'''
+                query ({", ".join(variables_definitions)}) {{
+                  {''.join(query_parts)}
+                }}
+                '''
 
         headers = {
             "Authorization": f"Bearer {monday_token}",
             "Content-Type": "application/json",
         }
 
-        response = requests.post(
-            'https://api.monday.com/v2',
+        raw_response_dict = await AsyncClient.request_json(
+            'POST',
+            MONDAY_API_URL,
             json={"query": query, "variables": variables},
             headers=headers
         )
 
-        raw_response_dict = response.json()
+        # Complexity and rate limit errors come back with partial or empty data, those offers are not missing
+        has_errors = bool(raw_response_dict.get('errors'))
+        if has_errors:
+            logger.warning(f'Monday returned errors: {raw_response_dict["errors"]}')
+
+        raw_data = raw_response_dict.get('data') or {}
 
-        raw_columns = raw_response_dict['data']['items'][0]['column_values'] if item_id else \
-            raw_response_dict['data']['boards'][0]['items_page']['items'][0]['column_values']
+        raw_items = {}
+        for item in raw_data.get('items') or []:
+            raw_items[int(item['id'])] = item
 
-        raw_offer_monday_fields = {column['column']['title']: column['text'] for column in raw_columns}
-        raw_offer_monday_fields['name'] = self.name
-        raw_offer_monday_fields['is_priority'] = True
-        raw_offer_monday_fields['creation_timestamp'] = time.time()
-        return raw_offer_monday_fields
+        boards = raw_data.get('boards') or [{}]
+
+        raw_offers_monday_fields = {}
+        for index, offer_name in enumerate(offer_names):
+            if item_id := WRONG_OFFERS.get(offer_name):
+                item = raw_items.get(item_id)
+                came_back_empty = raw_data.get('items') is not None
+            else:
+                items_page = boards[0].get(f'offer{index}')
+                item = items_page['items'][0] if items_page and items_page['items'] else None
+                came_back_empty = items_page is not None
+
+            if not item:
+                if not has_errors and came_back_empty:
+                    NegativeCache.add('monday_offer', f'{board_id}/{offer_name}')
+                continue
+
+            raw_offer_monday_fields = {column['column']['title']: column['text'] for column in item['column_values']}
+            raw_offer_monday_fields['name'] = offer_name
+            raw_offer_monday_fields['is_priority'] = True
+            raw_offer_monday_fields['creation_timestamp'] = time.time()
+            raw_offers_monday_fields[offer_name] = raw_offer_monday_fields
+
+        return raw_offers_monday_fields
 
     def _process_raw_offer_info(self, raw_offer_info, partners_folder_id):
         if not raw_offer_info:
@@ -251,6 +423,18 @@ class Offer:
         return offer_folder_id
 
     def get_offer_general_folder(self, partners_folder_id):
+        miss_key = f'{partners_folder_id}/{self.name}'
+        if NegativeCache.contains('offer_folder', miss_key):
+            logger.warning(f'No Partners with offer {self.name} was found in GoogleDrive (remembered miss)')
+            return
+
+        google_services.DriveFolderIndex.ensure_built(partners_folder_id)
+        for partner_folder in google_services.DriveFolderIndex.get_children(partners_folder_id):
+            offer_general_folder = google_services.DriveFolderIndex.find_folder(self.name, partner_folder['id'],
+                                                                                strict=False)
+            if offer_general_folder:
+                return offer_general_folder
+
         for partner_folder in google_services.GoogleDrive.get_folders_of_folder(partners_folder_id):
 
             partner_folder_id = partner_folder['id']
@@ -258,6 +442,7 @@ class Offer:
             if offer_general_folder:
                 return offer_general_folder
 
+        NegativeCache.add('offer_folder', miss_key)
         logger.warning(f'No Partners with offer {self.name} was found in GoogleDrive')
 
     def get_priority_footer_values(self, tableID, pages, text_column, link_column, id_column):
@@ -272,18 +457,15 @@ class Offer:
 
         logger.debug(f'Searching for footer for offer {self.name}')
 
-        priority_product_index, priority_product_page = None, None
-
-        for page in pages:
-            index = google_services.GoogleSheets.get_table_index_of_value(tableID, self.name,
-                                                                          f'{page}!A:A', is_row=False,
-                                                                          strict=False)
-
-            if index:
-                priority_product_index, priority_product_page = index, page
-                break
+        miss_key = f'{tableID}/{self.name}'
+        priority_row = None
+        if not NegativeCache.contains('priority_offer', miss_key):
+            priority_table = PriorityTable.get(tableID, pages, text_column, link_column, id_column)
+            priority_row = priority_table.find_offer(self.name)
+            if not priority_row:
+                NegativeCache.add('priority_offer', miss_key)
 
-        if not priority_product_index:
+        if not priority_row:
             self.update_offer_cache('is_priority', False)
             return {
                 'is_priority': False,
@@ -292,35 +474,21 @@ class Offer:
                 'unsub_id': ''
             }
 
-        priority_product_index += 1
-
-        text_value = google_services.GoogleSheets.get_data_from_range(
-            tableID, f'{priority_product_page}!{text_column}{priority_product_index}')
-
+        text_value = priority_row['text']
         if text_value:
             logger.info(f'Priority footer was found for {self.name}')
-            text_value = text_value[0][0]
         else:
             logger.debug(f'Priority footer not found for {self.name}')
-            text_value = ''
-
-        unsub_url = google_services.GoogleSheets.get_data_from_range(
-            tableID, f'{priority_product_page}!{link_column}{priority_product_index}')
 
+        unsub_url = priority_row['link']
         if not unsub_url:
             logger.warning('Unsub url not found')
-        else:
-            unsub_url = unsub_url[0][0]
 
         unsub_id = None
         if id_column:
-            unsub_id = google_services.GoogleSheets.get_data_from_range(
-                tableID, f'{priority_product_page}!{id_column}{priority_product_index}')
-
+            unsub_id = priority_row['id']
             if not unsub_id:
                 logger.warning('Unsub ID not found')
-            else:
-                unsub_id = unsub_id[0][0]
 
         return {
             'is_priority': True,
@@ -330,15 +498,10 @@ class Offer:
         }
 
     def update_offer_cache(self, key, new_value):
-        # offer_info = OffersCache.get_cached_offer(self.name)
-        offer_info = OffersCache.get_cache().get(self.name)
-        offer_info[key] = new_value
-
-        OffersCache.set_offer_cache(offer_info)
+        OffersCache.update_offer_cache(self.name, key, new_value)
 
     @staticmethod
-    def get_copy_files(lift_folder):
-        lift_folder_files = google_services.GoogleDrive.get_files_from_folder(lift_folder['id'])
+    def get_copy_files(lift_folder_files):
 
         lift_file = None
         mjml_found = False
@@ -367,31 +530,107 @@ class Offer:
         return lift_file, sl_file
 
     def get_copy_files_content(self, lift_number):
+        return AsyncClient.run(self.get_copy_files_content_async(lift_number))
+
+    async def get_copy_files_content_async(self, lift_number):
         logger.info(f'Searching copy files for offer {self.name} and lift {lift_number}')
 
-        lift_folder = google_services.GoogleDrive.get_folder_by_name(f'Lift {lift_number}',
-                                                                     self.fields['Copy Location'].split('/folders/')[1])
+        lift_folder = await google_services.GoogleDrive.get_folder_by_name_async(
+            f'Lift {lift_number}', self.fields['Copy Location'].split('/folders/')[1])
 
         if not lift_folder:
             logger.warning(
                 f'Could not find folder Lift {lift_number} in offer {self.name}. Please check if folder exist on google drive')
             lift_file, sl_file = None, None
         else:
-            lift_file, sl_file = self.get_copy_files(lift_folder)
+            lift_folder_files = await google_services.GoogleDrive.get_files_from_folder_async(lift_folder['id'])
+            lift_file, sl_file = self.get_copy_files(lift_folder_files)
 
-        lift_file_content, sl_file_content = None, None
-        if lift_file:
-            lift_file_content = google_services.GoogleDrive.get_file_content(lift_file)
-        else:
+        if not lift_file:
             logger.warning(f'Lift file for {self.name} was not found')
 
-        if sl_file:
-            sl_file_content = google_services.GoogleDrive.get_file_content(sl_file)
-        else:
+        if not sl_file:
             logger.warning(f'Sl file for {self.name} was not found')
 
+        # Lift and SL files are downloaded at the same time
+        lift_file_content, sl_file_content = await asyncio.gather(self.get_file_content_async(lift_file),
+                                                                  self.get_file_content_async(sl_file))
+
         return lift_file_content, sl_file_content
 
+    @staticmethod
+    async def get_file_content_async(file):
+        if not file:
+            return None
+
+        return await google_services.GoogleDrive.get_file_content_async(file)
+
+
+class PriorityTable:
+    snapshots = {}
+    lock = threading.Lock()
+
+    def __init__(self, table_id, pages, text_column, link_column, id_column):
+        self.table_id = table_id
+        self.pages = pages
+        self.columns = {'name': 'A', 'text': text_column, 'link': link_column}
+        if id_column:
+            self.columns['id'] = id_column
+
+        self.pages_rows = self.load_rows()
+        self.offers_rows = {}
+
+    @classmethod
+    def get(cls, table_id, pages, text_column, link_column, id_column):
+        snapshot_key = (table_id, tuple(pages), text_column, link_column, id_column)
+        with cls.lock:
+            if snapshot_key not in cls.snapshots:
+                cls.snapshots[snapshot_key] = cls(table_id, pages, text_column, link_column, id_column)
+
+            return cls.snapshots[snapshot_key]
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.snapshots = {}
+
+    def load_rows(self):
+        logger.debug(f'Loading priority table {self.table_id}')
+        ranges = [f'{page}!{column}:{column}' for page in self.pages for column in self.columns.values()]
+        columns_values = iter(google_services.GoogleSheets.batch_get(self.table_id, ranges))
+
+        pages_rows = {}
+        for page in self.pages:
+            page_columns = {key: next(columns_values) for key in self.columns}
+            page_rows = pages_rows.setdefault(page, [])
+            for index, name_cell in enumerate(page_columns['name']):
+                row = {'page': page, 'index': index,
+                       'name': name_cell[0].strip() if name_cell else None}
+
+                for key in ('text', 'link', 'id'):
+                    cells = page_columns.get(key, [])
+                    row[key] = cells[index][0] if index < len(cells) and cells[index] else ''
+
+                page_rows.append(row)
+
+        return pages_rows
+
+    def find_offer(self, offer_name):
+        if offer_name not in self.offers_rows:
+            self.offers_rows[offer_name] = self.search_offer(offer_name)
+
+        return self.offers_rows[offer_name]
+
+    def search_offer(self, offer_name):
+        for page in self.pages:
+            for row in self.pages_rows[page]:
+                if row['name'] and offer_name in row['name']:
+                    if row['index']:
+                        return row
+                    break
+
+        return None
+
 
 class OfferException(Exception):
     def __init__(self, offer_name, message):
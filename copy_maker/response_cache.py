@@ -0,0 +1,130 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds, max_bytes, path=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.path = None
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+        if path:
+            self.enable_persistence(path)
+
+    def configure(self, ttl_seconds=None, max_bytes=None, path=None):
+        with self.lock:
+            if ttl_seconds is not None:
+                self.ttl_seconds = ttl_seconds
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+                self.evict()
+            if path and path != self.path:
+                self.enable_persistence(path)
+
+    def enable_persistence(self, path):
+        if not self.path:
+            atexit.register(self.save)
+
+        self.path = path
+        self.load()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if entry:
+                self.delete(key)
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value, expires_at=None):
+        entry_size = len(json.dumps(value))
+        if entry_size > self.max_bytes:
+            logger.debug(f'Not caching response for {key}, it is bigger than whole cache')
+            return
+
+        with self.lock:
+            self.delete(key)
+            self.entries[key] = (value, expires_at or time.time() + self.ttl_seconds, entry_size)
+            self.size += entry_size
+            self.evict()
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry:
+                self.size -= entry[2]
+
+    def evict(self):
+        while self.size > self.max_bytes and self.entries:
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry[2]
+            logger.debug(f'Evicted cached response for {key}')
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'size': self.size, 'hits': self.hits, 'misses': self.misses}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        logger.debug(f'Loading cached responses from {self.path}')
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                saved_entries = json.load(file)
+        except Exception as e:
+            logger.warning(f'Could not load cached responses from {self.path}. Details : {e}')
+            return
+
+        now = time.time()
+        with self.lock:
+            for key, value, expires_at in saved_entries:
+                if expires_at > now:
+                    self.set(self.decode_key(key), value, expires_at)
+
+    def save(self):
+        if not self.path:
+            return
+
+        with self.lock:
+            now = time.time()
+            saved_entries = [[self.encode_key(key), value, expires_at]
+                             for key, (value, expires_at, entry_size) in self.entries.items() if expires_at > now]
+
+        logger.debug(f'Saving {len(saved_entries)} cached responses to {self.path}')
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(saved_entries, file)
+        os.replace(temp_path, self.path)
+
+    @classmethod
+    def encode_key(cls, key):
+        return [cls.encode_key(part) for part in key] if isinstance(key, tuple) else key
+
+    @classmethod
+    def decode_key(cls, key):
+        return tuple(cls.decode_key(part) for part in key) if isinstance(key, list) else key
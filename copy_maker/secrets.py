@@ -1,10 +1,17 @@
 import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 
 def update_credentials(new_info):
+    global CREDENTIALS
+    if new_info == CREDENTIALS:
+        logger.debug('Credentials did not change')
+        return
+
+    CREDENTIALS = new_info
     secrets = read_json_file(PATH_TO_SECRETS_FILE)
     secrets['CREDENTIALS'] = new_info
     write_json_file(PATH_TO_SECRETS_FILE, secrets)
@@ -18,9 +25,13 @@ def read_json_file(path):
 
 def write_json_file(path, data):
     logger.debug(f'Writing to {path}')
-    with open(path, 'w') as file:
+    # Written next to the file and moved over it, so a crash can't leave a half written secrets file
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
         json.dump(data, file, indent=4)
 
+    os.replace(temp_path, path)
+
 
 PATH_TO_SECRETS_FILE = 'copy_maker/secrets.json'
 secrets = read_json_file(PATH_TO_SECRETS_FILE)
@@ -2,84 +2,145 @@ import logging
 import random
 import re
 
+from .antispam import AntispamEngine
+from .templates import Template
+
 logger = logging.getLogger(__name__)
 
 
+# Style rules in the order they are applied, each one is (name, property, value pattern, new style template)
+STYLE_RULES = (
+    ('font_size', 'font-size', r'\s*:\s*(16|18|20)?px;', 'font-size: {};'),
+    ('font_family', 'font-family', r'\s*:\s*([^;"<>]+);?', 'font-family:{};'),
+    ('copy_width', 'width', r'\s*:\s*600\s*px', 'width:{}'),
+    ('elements_padding', 'padding', r'\s*:\s*10px\s+25px', 'padding:{} {}'),
+    ('copy_padding', 'padding', r'\s*:\s*(10|20)px\s+0(px|)', 'padding:{} 0'),
+    ('line_height', 'line-height', r'\s*:\s*1.5', 'line-height:{}'),
+    ('buttons_color', 'background-color', r'\s*:\s*#28B628\s*;', 'background-color: {};'),
+)
+# Rules with a fallback style that is changed when the rule itself matched nothing
+FALLBACK_RULES = ('font_family', 'elements_padding')
+TRACKING_LINK_PLACEHOLDER = 'urlhere'
+A_TAG_PATTERN = re.compile(r'<a\s+([^>]*)')
+PADDING_LEFT_PATTERN = re.compile(r'padding-left\s*:\s*([^;"]+)')
+PADDING_RIGHT_PATTERN = re.compile(r'padding-right\s*:\s*([^;"]+)')
+# Values with these characters can change where font-family and padding styles end
+UNSAFE_STYLE_VALUE_CHARS = frozenset(';"<>')
+# Used when the domain template.html is empty
+EMPTY_DOMAIN_TEMPLATE = '[COPY_HERE]<br><br><br><br><br>[PRIORITY_FOOTER_HERE]'
+
+
 class StylesHelper:
     def __init__(self, styles_settings):
         self.styles_settings = styles_settings
+        self.rules = self.compile_rules()
+
+        # The rules match disjoint spans, so one pass with all of them gives the same html as a pass per rule.
+        # Properties stay outside of the named groups, otherwise re can't skip ahead to the next property name
+        self.combined_pattern = re.compile('|'.join(f'{style_property}(?P<{name}>{value_pattern})'
+                                                    for name, style_property, value_pattern, _ in STYLE_RULES
+                                                    if name in self.rules))
+
+        self.template = Template(styles_settings['template'] or EMPTY_DOMAIN_TEMPLATE,
+                                 ['[COPY_HERE]', '[PRIORITY_FOOTER_HERE]', TRACKING_LINK_PLACEHOLDER], 'template.html')
+        self.priority_block_template = Template(styles_settings['priorityBlock'],
+                                                ['[PRIORITY_BODY]', TRACKING_LINK_PLACEHOLDER], 'priorityBlock')
+        self.priority_block_link_template = Template(styles_settings['priorityBlockLink'],
+                                                     ['[PRIORITY_UNSUB_URL]', '[PRIORITY_UNSUB_TEXT_URL]',
+                                                      TRACKING_LINK_PLACEHOLDER], 'priorityBlockLink')
+
+    def compile_rules(self):
+        enabled_rules = {
+            'font_size': self.styles_settings['fontSize'],
+            'font_family': self.styles_settings['fontFamily'],
+            'copy_width': self.styles_settings.get('copyWidth'),
+            'elements_padding': self.styles_settings['sideElementsPadding'] and self.styles_settings[
+                'upperDownElementsPadding'],
+            'copy_padding': self.styles_settings['upperDownCopyPadding'],
+            'line_height': self.styles_settings['lineHeight'],
+            'buttons_color': self.styles_settings.get('buttonLinksColor'),
+        }
 
-    def apply_styles(self, copy):
+        return {name: (re.compile(style_property + value_pattern), new_style)
+                for name, style_property, value_pattern, new_style in STYLE_RULES if enabled_rules[name]}
 
-        if self.styles_settings['antispam']:
-            if copy.lift_html:
-                copy.lift_html = self.antispam_text(copy.lift_html, self.styles_settings['antispamReplacements'])
+    def choose_style_values(self):
+        # calculate_value is called in the same order as the rules were applied before, so a seeded random
+        # picks the same values
+        values = {}
+        if 'font_size' in self.rules:
+            values['font_size'] = (self.calculate_value(self.styles_settings['fontSize']),)
 
-            if copy.lift_sls:
-                copy.lift_sls = self.antispam_text(copy.lift_sls, self.styles_settings['antispamReplacements'])
+        if 'font_family' in self.rules:
+            values['font_family'] = (self.calculate_value(self.styles_settings['fontFamily']),)
 
-        if self.styles_settings['fontSize']:
-            font_size = self.calculate_value(self.styles_settings['fontSize'])
+        if 'copy_width' in self.rules:
+            values['copy_width'] = (self.calculate_value(self.styles_settings['copyWidth']),)
 
-            copy.lift_html, success = self.replace_style(r'font-size\s*:\s*(16|18|20)?px;',
-                                                         f'font-size: {font_size};',
-                                                         copy.lift_html)
+        if 'elements_padding' in self.rules:
+            upper_down_elements_padding = self.calculate_value(self.styles_settings['upperDownElementsPadding'])
+            side_elements_padding = self.calculate_value(self.styles_settings['sideElementsPadding'])
+            values['elements_padding'] = (upper_down_elements_padding, side_elements_padding)
 
-        if self.styles_settings['fontFamily']:
+        if 'copy_padding' in self.rules:
+            values['copy_padding'] = (self.calculate_value(self.styles_settings['upperDownCopyPadding']),)
 
-            font_family = self.calculate_value(self.styles_settings['fontFamily'])
+        if 'line_height' in self.rules:
+            values['line_height'] = (self.calculate_value(self.styles_settings['lineHeight']),)
 
-            copy.lift_html, success = self.replace_style(r'font-family\s*:\s*([^;]+);?',
-                                                         f'font-family:{font_family};',
-                                                         copy.lift_html)
-            if not success:
-                copy.lift_html = copy.lift_html.replace('Roboto', self.styles_settings['fontFamily'])
+        if 'buttons_color' in self.rules:
+            values['buttons_color'] = (self.styles_settings['buttonLinksColor'],)
 
-        if self.styles_settings.get('copyWidth'):
-            copy_width = self.calculate_value(self.styles_settings['copyWidth'])
-            copy.lift_html, success = self.replace_style(r'width\s*:\s*600\s*px', f'width:{copy_width}', copy.lift_html)
-            if not success:
-                logger.warning('Copy width was not changed')
+        return values
 
-        if self.styles_settings['sideElementsPadding'] and self.styles_settings['upperDownElementsPadding']:
-            upper_down_elements_padding = self.calculate_value(self.styles_settings['upperDownElementsPadding'])
-            side_elements_padding = self.calculate_value(self.styles_settings['sideElementsPadding'])
+    def can_combine(self, new_styles, values):
+        for rule_values in values.values():
+            if any(UNSAFE_STYLE_VALUE_CHARS.intersection(str(value)) for value in rule_values):
+                return False
 
-            copy.lift_html, success = self.replace_style(r'padding\s*:\s*10px\s+25px',
-                                                         f'padding:{upper_down_elements_padding} {side_elements_padding}',
-                                                         copy.lift_html)
+        # A new style that matches a rule applied after it would be replaced again by a pass per rule
+        names = list(self.rules)
+        for index, name in enumerate(names):
+            for later_name in names[index + 1:]:
+                if self.rules[later_name][0].search(new_styles[name]):
+                    return False
 
-            if not success:
-                copy.lift_html, success = self.replace_style(r'padding-left\s*:\s*([^;"]+)',
-                                                             f'padding-left:{side_elements_padding}',
-                                                             copy.lift_html)
-                copy.lift_html, success = self.replace_style(r'padding-right\s*:\s*([^;"]+)',
-                                                             f'padding-right:{side_elements_padding}',
-                                                             copy.lift_html)
+        return True
 
-        if self.styles_settings['upperDownCopyPadding']:
-            upper_down_copy_padding = self.calculate_value(self.styles_settings['upperDownCopyPadding'])
+    def make_new_styles(self, values):
+        return {name: self.rules[name][1].format(*rule_values) for name, rule_values in values.items()}
 
-            copy.lift_html, success = self.replace_style(r'padding\s*:\s*(10|20)px\s+0(px|)',
-                                                         f'padding:{upper_down_copy_padding} 0', copy.lift_html)
+    def replace_styles(self, text, new_styles, replaced):
+        def replace(match):
+            replaced.add(match.lastgroup)
+            return new_styles[match.lastgroup]
 
-        if self.styles_settings['lineHeight']:
-            line_height = self.calculate_value(self.styles_settings['lineHeight'])
-            copy.lift_html, success = self.replace_style(r'line-height\s*:\s*1.5', f'line-height:{line_height}',
-                                                         copy.lift_html)
+        return self.combined_pattern.sub(replace, text)
 
-        links_color = self.styles_settings['linksColor'] if self.styles_settings[
-                                                                'linksColor'] != 'random-blue' else self.get_random_blue()
+    def replace_styles_one_by_one(self, text, new_styles, replaced):
+        for name, (pattern, _) in self.rules.items():
+            text, success = self.replace_style(pattern, new_styles[name], text)
+            if success:
+                replaced.add(name)
 
-        buttons_color = self.styles_settings.get('buttonLinksColor')
-        if buttons_color:
-            copy.lift_html, success = self.replace_style(r'background-color\s*:\s*#28B628\s*;',
-                                                         f'background-color: {buttons_color};', copy.lift_html)
+        return text
 
-        add_es_button = self.styles_settings['addEsButton']
-        copy.lift_html = self.change_links(copy.lift_html, links_color, buttons_color, add_es_button)
+    def get_fallbacks(self, replaced):
+        if 'copy_width' in self.rules and 'copy_width' not in replaced:
+            logger.warning('Copy width was not changed')
 
-        return copy
+        return frozenset(name for name in FALLBACK_RULES if name in self.rules and name not in replaced)
+
+    def replace_fallback_styles(self, text, values, fallbacks):
+        if 'font_family' in fallbacks and 'Roboto' in text:
+            text = text.replace('Roboto', self.styles_settings['fontFamily'])
+
+        if 'elements_padding' in fallbacks and 'padding-' in text:
+            side_elements_padding = values['elements_padding'][1]
+            text, success = self.replace_style(PADDING_LEFT_PATTERN, f'padding-left:{side_elements_padding}', text)
+            text, success = self.replace_style(PADDING_RIGHT_PATTERN, f'padding-right:{side_elements_padding}', text)
+
+        return text
 
     @staticmethod
     def get_random_blue():
@@ -103,31 +164,18 @@ class StylesHelper:
     @staticmethod
     def replace_style(style_pattern, new_style, source):
 
-        pattern = re.compile(style_pattern)
-        if not pattern.search(source):
-            return source, False
-
-        new_lift_html = pattern.sub(lambda match: new_style, source)
+        new_source, count = re.subn(style_pattern, lambda match: new_style, source)
 
-        return new_lift_html, True
+        return new_source, count > 0
 
     @classmethod
-    def change_links(cls, html_copy, link_color, buttons_color, add_es_button):
-        a_tag_pattern = r'<a\s+([^>]*)'
+    def change_a_tag(cls, a_tag, link_color, buttons_color, add_es_button):
+        if link_color:
+            a_tag = cls.change_link_color(link_color, buttons_color, a_tag)
+        if add_es_button:
+            a_tag = cls.add_es_button(a_tag)
 
-        all_a_tags = re.findall(a_tag_pattern, html_copy)
-
-        for old_a_tag in all_a_tags:
-            new_a_tag = old_a_tag
-            if link_color:
-                new_a_tag = cls.change_link_color(link_color, buttons_color, old_a_tag)
-            if add_es_button:
-                new_a_tag = cls.add_es_button(new_a_tag)
-                add_es_button = False
-
-            html_copy = html_copy.replace(old_a_tag, new_a_tag, 1)
-
-        return html_copy
+        return a_tag
 
     @classmethod
     def add_es_button(cls, a_tag):
@@ -168,85 +216,9 @@ class StylesHelper:
 
     @staticmethod
     def antispam_text(text, custom_replacements):
+        return AntispamEngine.get(custom_replacements).apply(text)
 
-        replacements = {
-            "A": "А",
-            "E": "Е",
-            "I": "І",
-            "O": "О",
-            "P": "Р",
-            "T": "Т",
-            "H": "Н",
-            "K": "К",
-            "X": "Х",
-            "C": "С",
-            "B": "В",
-            "M": "М",
-            "e": "е",
-            "y": "у",
-            "i": "і",
-            "o": "о",
-            "a": "а",
-            "x": "х",
-            "c": "с",
-            "%": "％",
-            "$": "＄",
-            "&#36;": "＄"
-        }
-
-        replacements = {**replacements, **custom_replacements}
-
-        new_text = ''
-        inside_tag = False
-        inside_str_emoji = False
-        str_emoji = ''
-        fake_str_emoji = ''
-
-        for char in text:
-            match char:
-                case '<':
-                    inside_tag = True
-
-                case '>':
-                    inside_tag = False
-
-                case '&':
-                    if inside_str_emoji:
-                        new_text += fake_str_emoji
-                        str_emoji = ''
-                        fake_str_emoji = ''
-
-                    inside_str_emoji = True
-
-                case ';':
-                    inside_str_emoji = False
-                    str_emoji += char
-                    fake_str_emoji += replacements.get(char) or char
-                    replaced_char = replacements.get(str_emoji)
-                    new_text += replaced_char or fake_str_emoji
-
-                    str_emoji = ''
-                    fake_str_emoji = ''
-                    continue
-
-            if inside_str_emoji:
-                str_emoji += char
-                fake_str_emoji += replacements.get(char) or char
-                continue
-
-            if (not inside_tag) and (not inside_str_emoji):
-                replaced_char = replacements.get(char) or char
-            else:
-                replaced_char = char
-
-            new_text += replaced_char
-
-        if inside_str_emoji:
-            new_text += fake_str_emoji
-
-        return new_text
-
-    def make_priority_footer_html(self, footer_text, url):
+    def make_priority_footer_html(self, footer_text, url, tracking_link):
         footer_link_keywords = [
             'edit your e-mail notification preferences or unsubscribe',
             'Privacy Policy',
@@ -264,10 +236,11 @@ class StylesHelper:
 
         for keyword in footer_link_keywords:
             if keyword in footer_text:
-                unsub_footer_url = self.styles_settings['priorityBlockLink']
-
-                unsub_footer_url = unsub_footer_url.replace('[PRIORITY_UNSUB_URL]', url)
-                unsub_footer_url = unsub_footer_url.replace('[PRIORITY_UNSUB_TEXT_URL]', keyword)
+                unsub_footer_url = self.priority_block_link_template.render({
+                    '[PRIORITY_UNSUB_URL]': url,
+                    '[PRIORITY_UNSUB_TEXT_URL]': keyword,
+                    TRACKING_LINK_PLACEHOLDER: tracking_link,
+                })
 
                 priority_block = footer_text.replace(keyword, unsub_footer_url)
                 return priority_block
@@ -276,24 +249,23 @@ class StylesHelper:
         footer_text += f'\n\nUNSUB-URL: {url}'
         return footer_text
 
-    def add_template(self, copy):
-        template = self.styles_settings['template']
-
-        if copy.priority_info['is_priority']:
-            priority_body = self.make_priority_footer_html(copy.priority_info['unsub_text'],
-                                                           copy.priority_info['unsub_link'])
-
-            priority_block = self.styles_settings['priorityBlock'].replace('[PRIORITY_BODY]', priority_body)
+    def make_priority_block(self, copy):
+        if not copy.priority_info['is_priority']:
+            return ''
 
-        else:
-            priority_block = ''
+        priority_body = self.make_priority_footer_html(copy.priority_info['unsub_text'],
+                                                       copy.priority_info['unsub_link'], copy.tracking_link)
 
-        if not template:
-            return copy.lift_html + '<br><br><br><br><br>' + priority_block
+        return self.priority_block_template.render({
+            '[PRIORITY_BODY]': priority_body,
+            TRACKING_LINK_PLACEHOLDER: copy.tracking_link,
+        })
 
-        template = template.replace('[COPY_HERE]', copy.lift_html)
-        template = template.replace('[PRIORITY_FOOTER_HERE]', priority_block)
-
-        copy.lift_html = template
+    def add_template(self, copy):
+        copy.lift_html = self.template.render({
+            '[COPY_HERE]': copy.lift_html,
+            '[PRIORITY_FOOTER_HERE]': self.make_priority_block(copy),
+            TRACKING_LINK_PLACEHOLDER: copy.tracking_link,
+        })
 
         return copy
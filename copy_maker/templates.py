@@ -0,0 +1,31 @@
+import re
+
+# Anything that looks like a placeholder has to be one the template knows about
+PLACEHOLDER_PATTERN = r'\[[A-Z][A-Z_]*\]'
+
+
+class Template:
+    def __init__(self, text, placeholders, name):
+        self.name = name
+        self.placeholders = frozenset(placeholders)
+
+        markers = sorted(self.placeholders, key=len, reverse=True)
+        pattern = '|'.join([re.escape(marker) for marker in markers] + [PLACEHOLDER_PATTERN])
+        # Split keeps the matched placeholders, so literal segments and slots alternate
+        self.parts = re.split(f'({pattern})', text)
+
+        for slot in self.parts[1::2]:
+            if slot not in self.placeholders:
+                raise UnknownPlaceholder(name, slot, self.placeholders)
+
+    def render(self, values):
+        parts = self.parts.copy()
+        parts[1::2] = [values[slot] for slot in self.parts[1::2]]
+
+        return ''.join(parts)
+
+
+class UnknownPlaceholder(Exception):
+    def __init__(self, template_name, placeholder, placeholders):
+        message = f'Unknown placeholder {placeholder} in {template_name}, expected one of: {', '.join(sorted(placeholders))}'
+        super().__init__(message)
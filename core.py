@@ -1,12 +1,13 @@
+import asyncio
 import json
 import logging
 import os
 import shutil
 import sys
+import threading
+import time
 import traceback
-
-import requests
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 
 import copy_maker
 import default_config
@@ -15,12 +16,24 @@ logger = logging.getLogger(__name__)
 
 
 class Core:
+    locks = {}
+    locks_lock = threading.Lock()
+
     def __init__(self):
         self.check_paths()
 
         self.settings = json.load(open('GeneralSettings.json'))
+        copy_maker.offer.OffersCache.stale_while_revalidate = self.settings.get('StaleWhileRevalidate', False)
+        copy_maker.google_services.GoogleSheets.configure_cache(self.settings.get('SheetsCacheMinutes', 60),
+                                                                self.settings.get('SheetsCacheMegabytes', 32),
+                                                                self.settings.get('PersistSheetsCache', True))
+        if drive_sync_interval_minutes := self.settings.get('DriveSyncIntervalMinutes'):
+            copy_maker.google_services.DriveChangesSync.start_background_sync(drive_sync_interval_minutes * 60)
+        copy_maker.images.ImageOptimizer.configure(self.settings.get('OptimizeImages', False),
+                                                   self.settings.get('ImagesMaxWidth', 1100),
+                                                   self.settings.get('ImagesQuality', 85))
         self.custom_sls = json.load(open('custom_sls.json'))
-        self.domains = self.get_domains()
+        self.domains = copy_maker.domain_registry.DomainRegistry()
 
     @staticmethod
     def check_paths():
@@ -44,28 +57,6 @@ class Core:
 
         os.makedirs('Images', exist_ok=True)
 
-    @staticmethod
-    def get_domains():
-        domains_folder = 'Domains/'
-        domains = {}
-        for name in os.listdir(domains_folder):
-            try:
-                if name == 'DefaultDomain':
-                    continue
-
-                full_path = os.path.join(domains_folder, name)
-                if os.path.isdir(full_path):
-                    domain_dict = json.load(open(full_path + '/settings.json'))
-                    domain_dict['styles']['template'] = open(full_path + '/template.html').read()
-                    domain = copy_maker.domain.Domain(domain_dict)
-
-                    domains[name] = domain
-            except Exception as e:
-                logger.error(f'Error parsing domain in folder "{name}"')
-                logger.debug(traceback.format_exc())
-
-        return domains
-
     @staticmethod
     def exit():
         exit()
@@ -73,14 +64,52 @@ class Core:
     @staticmethod
     def restart_script():
         logger.debug('Restarting')
+        # Nothing was cached if google services were never imported
+        if google_services := sys.modules.get('copy_maker.google_services'):
+            google_services.GoogleSheets.cache.save()
         os.execl(sys.executable, sys.executable, *sys.argv)
 
     @staticmethod
     def clear_cache(option):
-        copy_maker.offer.OffersCache.clear_cache(option)
+        match option:
+            case 'misses':
+                copy_maker.negative_cache.NegativeCache.clear()
+            case 'drive-index':
+                copy_maker.google_services.DriveFolderIndex.clear()
+            case 'files':
+                copy_maker.google_services.DriveContentCache.clear()
+            case 'sheets':
+                copy_maker.google_services.GoogleSheets.cache.clear()
+            case 'all':
+                copy_maker.offer.OffersCache.clear_cache(option)
+                copy_maker.negative_cache.NegativeCache.clear()
+                copy_maker.google_services.DriveFolderIndex.clear()
+                copy_maker.google_services.DriveContentCache.clear()
+                copy_maker.google_services.GoogleSheets.cache.clear()
+            case _:
+                copy_maker.offer.OffersCache.clear_cache(option)
 
     @staticmethod
-    def create_new_domain(domain_name, template_domain_name=None):
+    def get_cache_info():
+        cache_info = [f'Google Drive folders index: {copy_maker.google_services.DriveFolderIndex.get_size()} folders',
+                      f'Google Drive files cache: '
+                      f'{copy_maker.google_services.DriveContentCache.get_size() / 1024 / 1024:.1f} MB']
+
+        sheets_cache_stats = copy_maker.google_services.GoogleSheets.cache.get_stats()
+        cache_info.append(f'Google Sheets cache: {sheets_cache_stats['entries']} responses, '
+                          f'{sheets_cache_stats['size'] / 1024 / 1024:.1f} MB, '
+                          f'{sheets_cache_stats['hits']} hits, {sheets_cache_stats['misses']} misses')
+        images_count, images_size = copy_maker.images.ImageStore.get_size()
+        cache_info.append(f'Images store: {images_count} images, {images_size / 1024 / 1024:.1f} MB')
+        misses = copy_maker.negative_cache.NegativeCache.get_entries()
+        cache_info.append(f'Remembered misses: {len(misses)}')
+        for kind, key, creation_timestamp in misses:
+            minutes_ago = int((time.time() - creation_timestamp) // 60)
+            cache_info.append(f'    {kind} : {key} ({minutes_ago} min ago)')
+
+        return cache_info
+
+    def create_new_domain(self, domain_name, template_domain_name=None):
         if not domain_name:
             logger.warning('Domain Name cant be empty')
             return
@@ -101,26 +130,42 @@ class Core:
             shutil.copy('Domains/DefaultDomain/settings.json', domain_folder_path)
             shutil.copy('Domains/DefaultDomain/template.html', domain_folder_path)
 
+        self.domains.register(domain_name)
+
+    @staticmethod
+    def start_run():
+        copy_maker.offer.PriorityTable.clear()
+        copy_maker.domain.BroadcastGrid.clear()
+
     def make_domain(self, domain_name, broadcast_date, get_copies_manually_callback, str_copies=None):
         domain = self.get_domain(domain_name)
         copies, max_len_str_copy = self.get_copies(str_copies, domain, broadcast_date, get_copies_manually_callback)
+        self.prefetch_offers(domain, [copy.offer_name for copy in copies])
 
         domain_bc_name = domain.broadcast['name']
         date = broadcast_date.replace('/', '.')
         path_to_domain_results = self.get_domain_result_path(domain_bc_name, date)
 
-        copies_results = []
-
         message = f'Processing copies: {", ".join([copy.str_rep for copy in copies])}'
         logger.info(message)
-        # yield message
 
-        for copy in copies:
+        found_copies = self.find_copies(domain, copies)
+        with ThreadPoolExecutor(max_workers=self.settings.get('CopyWorkers', 1),
+                                thread_name_prefix='make-copy') as executor:
+            made_copies = list(executor.map(
+                lambda copy: copy and self.make_and_save_copy(copy, domain, date, path_to_domain_results),
+                found_copies))
+
+        if self.settings['SaveImages']:
+            self.save_images(made_copies, date)
+
+        copies_results = []
+        for copy in made_copies:
+            if not copy:
+                continue
+
             try:
-                # yield f'Making {copy.str_rep}'
-                copy = self.make_copy(copy, domain, path_to_domain_results)
-                # yield f'Saving {copy.str_rep}'
-                self.save_copy(copy, domain_bc_name, date, path_to_domain_results)
+                self.save_sl_file(copy, domain_bc_name, date, path_to_domain_results)
 
                 copies_results.append(self.get_copy_result(copy, max_len_str_copy))
                 logger.debug(self.get_copy_result(copy, max_len_str_copy))
@@ -131,9 +176,83 @@ class Core:
 
         return copies_results
 
+    async def make_domain_async(self, domain_name, broadcast_date, get_copies_manually_callback, str_copies=None):
+        return await asyncio.to_thread(self.make_domain, domain_name, broadcast_date, get_copies_manually_callback,
+                                       str_copies)
+
+    async def make_all_async(self, domain_names, broadcast_date, get_copies_manually_callback, workers=None):
+        semaphore = asyncio.Semaphore(workers or self.settings.get('MakeAllWorkers', 1))
+
+        async def make_one(domain_name):
+            async with semaphore:
+                logger.info(f'Making domain {domain_name}')
+                return await self.make_domain_async(domain_name, broadcast_date, get_copies_manually_callback)
+
+        domains_results = await asyncio.gather(*(make_one(domain_name) for domain_name in domain_names),
+                                               return_exceptions=True)
+        return dict(zip(domain_names, domains_results))
+
+    @staticmethod
+    def find_copies(domain, copies):
+        found_copies = []
+        for copy, found_copy in zip(copies, domain.find_copies(copies)):
+            if isinstance(found_copy, Exception):
+                logger.error(f'Error while making copy {copy.str_rep}. Details : {found_copy}')
+                logger.debug(''.join(traceback.format_exception(found_copy)))
+                found_copy = None
+
+            found_copies.append(found_copy)
+
+        return found_copies
+
+    def make_and_save_copy(self, copy, domain, date, path_to_domain_results):
+        try:
+            copy = self.make_copy(copy, domain, path_to_domain_results)
+            self.save_copy(copy, date, path_to_domain_results)
+
+            return copy
+
+        except Exception as e:
+            logger.error(f'Error while making copy {copy.str_rep}. Details : {e}')
+            logger.debug(traceback.format_exc())
+
+    def prefetch_domains(self, domain_names, broadcast_date):
+        domains_offers = {}
+        for domain_name in domain_names:
+            try:
+                domain = self.get_domain(domain_name)
+                str_copies = domain.get_copies_from_broadcast(broadcast_date) or []
+            except Exception as e:
+                logger.warning(f'Could not get copies of domain {domain_name} for prefetch. Details : {e}')
+                logger.debug(traceback.format_exc())
+                continue
+
+            offers_key = (domain.products['mondayId'], domain.products['partnersFolderId'])
+            domain, offer_names = domains_offers.setdefault(offers_key, (domain, []))
+            for str_copy in str_copies:
+                try:
+                    offer_names.append(domain.create_copy(str_copy.strip()).offer_name)
+                except Exception:
+                    continue
+
+        for domain, offer_names in domains_offers.values():
+            self.prefetch_offers(domain, offer_names)
+
+    @staticmethod
+    def prefetch_offers(domain, offer_names):
+        try:
+            domain.prefetch_offers(offer_names)
+        except Exception as e:
+            logger.warning(f'Error while prefetching offers. Details : {e}')
+            logger.debug(traceback.format_exc())
+
     def get_domain(self, domain_name):
         domain = self.domains.get(domain_name)
         if not domain:
+            if error := self.domains.get_error(domain_name):
+                raise Exception(f'Domain {domain_name} failed to parse, fix its settings.json or template.html. '
+                                f'Details : {error}')
+
             raise Exception(f'No domain with given name {domain_name}')
 
         return domain
@@ -172,7 +291,6 @@ class Core:
 
     @staticmethod
     def make_copy(copy, domain, path_to_domain_results):
-        copy = domain.find_copy(copy)
         if not copy.lift_html:
             logger.info(f'Html was not found for {copy.str_rep}, trying to read from local file')
             file_name = copy.str_rep + ('-Priority' if copy.priority_info['is_priority'] else '')
@@ -186,13 +304,7 @@ class Core:
 
         copy = domain.make_tracking_link(copy)
         copy = domain.make_unsub_link(copy)
-        copy = domain.process_images(copy)
-
-        styles_helper = copy_maker.styles_helper.StylesHelper(domain.styles)
-        copy = styles_helper.apply_styles(copy)
-        copy = styles_helper.add_template(copy)
-
-        copy.lift_html = copy.lift_html.replace('urlhere', copy.tracking_link)
+        copy = domain.copy_pipeline.run(copy)
 
         return copy
 
@@ -207,20 +319,22 @@ class Core:
 
         return result
 
-    def save_copy(self, copy, domain_bc_name, date, path_to_domain_results):
+    def save_copy(self, copy, date, path_to_domain_results):
         self.save_lift_file(copy, path_to_domain_results)
 
         if custom_sls := (self.custom_sls.get(copy.offer_name)):
             copy.custom_sls = custom_sls
-        self.save_sl_file(copy, domain_bc_name, date, path_to_domain_results)
 
-        save_image_path = self.settings['ImagesDirectory'] + f'{date}/'
         if copy.img_code:
+            save_image_path = self.settings['ImagesDirectory'] + f'{date}/'
             self.find_custom_image(f'{copy.offer_name}_{copy.img_code}', save_image_path)
 
-        if self.settings['SaveImages']:
-            for index, image_url in enumerate(copy.lift_images):
-                self.save_image(f'{copy.offer_name}{copy.lift_number}-image-{index + 1}', image_url, save_image_path)
+    def save_images(self, copies, date):
+        save_image_path = self.settings['ImagesDirectory'] + f'{date}/'
+        images = [(f'{copy.offer_name}{copy.lift_number}-image-{index + 1}', image_url, save_image_path)
+                  for copy in copies if copy for index, image_url in enumerate(copy.lift_images)]
+
+        copy_maker.images.ImageDownloader.save_images(images)
 
     @staticmethod
     def save_lift_file(copy, path_to_domain_results):
@@ -230,9 +344,14 @@ class Core:
             file.write(copy.lift_html)
             logger.debug(f'Successfully saved lift file for {copy.str_rep}')
 
-    @staticmethod
-    def save_sl_file(copy, domain_bc_name, date, path_to_domain_results):
+    @classmethod
+    def save_sl_file(cls, copy, domain_bc_name, date, path_to_domain_results):
         path_to_sls_file = path_to_domain_results + f'SLs-{domain_bc_name}-{date}.txt'
+        with cls.get_lock(f'sls:{path_to_sls_file}'):
+            cls._save_sl_file(copy, path_to_sls_file)
+
+    @staticmethod
+    def _save_sl_file(copy, path_to_sls_file):
 
         if os.path.exists(path_to_sls_file):
             with open(path_to_sls_file, 'r', encoding='utf-8') as file:
@@ -278,71 +397,39 @@ class Core:
             file.write(copy_sls)
             logger.info(f'Successfully add sls for {copy.str_rep} in SLs.txt')
 
-    @staticmethod
-    def save_image(image_file_name, image_url, save_image_path):
-        try:
-
-            if not os.path.exists(save_image_path):
-                os.makedirs(save_image_path)
+    @classmethod
+    def get_lock(cls, key):
+        with cls.locks_lock:
+            return cls.locks.setdefault(key, threading.Lock())
 
-            temp_full_image_path = 'Images/' + image_file_name
-
-            with os.scandir(save_image_path) as entries:
-                for entry in entries:
-                    if entry.is_file() and image_file_name in entry.name:
-                        logger.debug(f'Not saving {image_file_name} - image already saved')
-                        return
-
-            with os.scandir('Images/') as entries:
-                for entry in entries:
-                    if entry.is_file() and image_file_name in entry.name:
-                        logger.debug(f'Image {image_file_name} already downloaded, copying')
-                        shutil.copy(entry.path, save_image_path + entry.name)
-                        return
-
-            logger.debug(f'Saving {image_file_name} to {temp_full_image_path}')
-            with open(temp_full_image_path, 'wb') as file:
-                response = requests.get(image_url, stream=True)
-                if not response.ok:
-                    logger.warning(
-                        f'Error while saving image {image_file_name}. Request status code {response.status_code}')
-
-                    return
-
-                for chunk in response.iter_content(512):
-                    file.write(chunk)
-
-            img = Image.open(temp_full_image_path)
-            ext = img.format.lower()
-            img.close()
-
-            new_full_image_path = temp_full_image_path + f'.{ext}'
-
-            os.rename(temp_full_image_path, new_full_image_path)
-
-            shutil.copy(new_full_image_path, save_image_path + image_file_name + f'.{ext}')
-
-        except Exception as e:
-            logger.error(f'Error while saving image {image_file_name}. Details : {e}')
-            logger.debug(traceback.format_exc())
+    @classmethod
+    def find_custom_image(cls, image_file_name, save_image_path):
+        with cls.get_lock(f'image:{image_file_name}'):
+            cls._find_custom_image(image_file_name, save_image_path)
 
     @staticmethod
-    def find_custom_image(image_file_name, save_image_path):
+    def _find_custom_image(image_file_name, save_image_path):
         if not os.path.exists(save_image_path):
             os.makedirs(save_image_path)
 
-        with os.scandir(save_image_path) as entries:
-            for entry in entries:
-                if entry.is_file() and image_file_name in entry.name:
-                    logger.debug(f'Not saving custom image {image_file_name} - image already saved')
-                    return
+        if copy_maker.images.ImageIndex.find_prefix(save_image_path, image_file_name):
+            logger.debug(f'Not saving custom image {image_file_name} - image already saved')
+            return
+
+        if custom_image_name := copy_maker.images.ImageIndex.find_prefix('Images/', image_file_name):
+            logger.info(f'Found custom image {image_file_name}, linking')
+            copy_maker.images.ImageStore.link('Images/' + custom_image_name, save_image_path + custom_image_name)
+
+
+core = None
+core_lock = threading.Lock()
 
-        with os.scandir('Images/') as entries:
-            for entry in entries:
-                if entry.is_file() and image_file_name in entry.name:
-                    logger.info(f'Found custom image {image_file_name}, copying')
-                    shutil.copy(entry.path, save_image_path + entry.name)
-                    return
 
+def get_core():
+    global core
+    if core is None:
+        with core_lock:
+            if core is None:
+                core = Core()
 
-core = Core()
+    return core
@@ -3,7 +3,17 @@ default_general_settings = r'''
     "ResultsDirectory": "",
     "ResultsDirectoryType": "Domain-Date",
     "ImagesDirectory": "",
-    "SaveImages": false
+    "SaveImages": false,
+    "OptimizeImages": false,
+    "ImagesMaxWidth": 1100,
+    "ImagesQuality": 85,
+    "MakeAllWorkers": 4,
+    "CopyWorkers": 4,
+    "StaleWhileRevalidate": false,
+    "DriveSyncIntervalMinutes": 0,
+    "SheetsCacheMinutes": 60,
+    "SheetsCacheMegabytes": 32,
+    "PersistSheetsCache": true
 }
 '''
 
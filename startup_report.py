@@ -0,0 +1,48 @@
+import logging
+import subprocess
+import sys
+import time
+
+STARTED_AT = time.perf_counter()
+STARTUP_REPORT_FLAG = '--startup-report'
+IMPORT_REPORT_ROWS = 20
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return STARTUP_REPORT_FLAG in sys.argv
+
+
+def report_ready():
+    startup_milliseconds = (time.perf_counter() - STARTED_AT) * 1000
+    logger.debug(f'Ready for input in {startup_milliseconds:.0f} ms')
+
+    if is_enabled():
+        print_import_report()
+        print(f'Ready for input in {startup_milliseconds:.0f} ms')
+
+
+def get_import_times(module_name):
+    # Same numbers as python -X importtime, measured in a fresh interpreter so nothing is imported yet
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                            capture_output=True, text=True)
+
+    import_times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_microseconds, cumulative_microseconds, name = line.removeprefix('import time:').split('|')
+        import_times.append((int(cumulative_microseconds), int(self_microseconds), name.strip()))
+
+    return import_times
+
+
+def print_import_report(module_name='cli_ui'):
+    import_times = sorted(get_import_times(module_name), reverse=True)
+
+    print(f'Slowest imports of {module_name}:')
+    print(f'{"module":<50}{"self ms":>10}{"total ms":>10}')
+    for cumulative_microseconds, self_microseconds, name in import_times[:IMPORT_REPORT_ROWS]:
+        print(f'{name:<50}{self_microseconds / 1000:>10.1f}{cumulative_microseconds / 1000:>10.1f}')
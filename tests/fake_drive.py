@@ -0,0 +1,58 @@
+"""A local stand-in for the Google Drive changes endpoints that serves canned pages."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeDriveServer:
+    def __init__(self, start_page_token, changes_pages):
+        # Page token -> changes response, exactly as the Drive API would return it
+        self.start_page_token = start_page_token
+        self.changes_pages = dict(changes_pages)
+        self.requests = []
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-drive', daemon=True)
+
+    @property
+    def api_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_handler(self):
+        fake_drive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                fake_drive.requests.append((url.path, params, self.headers.get('Authorization')))
+
+                match url.path:
+                    case '/changes/startPageToken':
+                        self.send_json(200, {'startPageToken': fake_drive.start_page_token})
+                    case '/changes' if params.get('pageToken') in fake_drive.changes_pages:
+                        self.send_json(200, fake_drive.changes_pages[params['pageToken']])
+                    case _:
+                        self.send_json(404, {'error': {'code': 404, 'message': f'Unknown request {self.path}'}})
+
+            def send_json(self, status, body):
+                content = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
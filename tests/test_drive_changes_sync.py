@@ -0,0 +1,133 @@
+"""Runs DriveChangesSync against a local fake Drive endpoint.
+
+Run from the repository root: python -m unittest discover -s tests -t .
+"""
+import importlib
+import json
+import os
+import tempfile
+import unittest
+
+from tests.fake_drive import FakeDriveServer
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Three pages: a folder added to a listed folder, an edited lift file, then a removed folder
+CHANGES_PAGES = {
+    '10': {'nextPageToken': '11', 'changes': [
+        {'fileId': 'offer-b', 'removed': False,
+         'file': {'id': 'offer-b', 'name': 'Offer B', 'mimeType': FOLDER_MIME_TYPE, 'parents': ['partner-2'],
+                  'trashed': False}},
+    ]},
+    '11': {'nextPageToken': '12', 'changes': [
+        {'fileId': 'lift-a', 'removed': False,
+         'file': {'id': 'lift-a', 'name': 'lift.html', 'mimeType': 'text/html', 'parents': ['html-a'],
+                  'trashed': False}},
+    ]},
+    '12': {'newStartPageToken': '20', 'changes': [
+        {'fileId': 'offer-a', 'removed': True},
+    ]},
+}
+
+working_directory = None
+previous_directory = None
+google_services = None
+negative_cache = None
+
+
+def setUpModule():
+    global working_directory, previous_directory, google_services, negative_cache
+
+    # copy_maker reads its secrets and cache files relative to the working directory
+    working_directory = tempfile.TemporaryDirectory()
+    previous_directory = os.getcwd()
+    os.chdir(working_directory.name)
+    os.makedirs('copy_maker')
+    with open('copy_maker/secrets.json', 'w') as file:
+        json.dump({'MONDAY_TOKEN': 'monday-token', 'OAUTH_CLIENT': {}}, file)
+
+    from google.oauth2.credentials import Credentials
+
+    google_services = importlib.import_module('copy_maker.google_services')
+    negative_cache = importlib.import_module('copy_maker.negative_cache')
+    google_services.CredentialsManager.credentials = Credentials(token='test-token')
+
+
+def tearDownModule():
+    google_services.AsyncClient.run(google_services.AsyncClient.close())
+    os.chdir(previous_directory)
+    working_directory.cleanup()
+
+
+class DriveChangesSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.fake_drive = FakeDriveServer('10', CHANGES_PAGES).start()
+        google_services.DriveChangesSync.api_url = self.fake_drive.api_url
+
+        google_services.DriveFolderIndex.clear()
+        google_services.DriveContentCache.clear()
+        negative_cache.NegativeCache.clear()
+        # Reading the token creates the sync state table, so it can be emptied
+        google_services.DriveChangesSync.get_page_token()
+        google_services.cache_storage.CacheStorage.execute('DELETE FROM drive_sync_state')
+
+    def tearDown(self):
+        google_services.DriveChangesSync.api_url = None
+        self.fake_drive.stop()
+
+    def test_first_sync_only_stores_start_page_token(self):
+        google_services.DriveChangesSync.apply_changes()
+
+        self.assertEqual(google_services.DriveChangesSync.get_page_token(), '10')
+        self.assertEqual([path for path, params, authorization in self.fake_drive.requests],
+                         ['/changes/startPageToken'])
+
+    def test_sync_applies_all_pages(self):
+        google_services.DriveFolderIndex.set_listings('root', {
+            'partner-1': [{'id': 'offer-a', 'name': 'Offer A'}],
+            'partner-2': [],
+            'offer-a': [{'id': 'html-a', 'name': 'HTML+SL'}],
+        })
+        google_services.DriveContentCache.write({'id': 'lift-a', 'md5Checksum': 'old'}, 'html', b'old lift')
+        google_services.DriveContentCache.write({'id': 'lift-b', 'md5Checksum': 'old'}, 'html', b'other lift')
+        negative_cache.NegativeCache.add('drive_folder', 'partner-2/Offer B')
+        negative_cache.NegativeCache.add('drive_folder', 'partner-3/Offer C')
+        google_services.DriveChangesSync.set_page_token('10')
+
+        google_services.DriveChangesSync.apply_changes()
+
+        self.assertEqual([params['pageToken'] for path, params, authorization in self.fake_drive.requests],
+                         ['10', '11', '12'])
+        self.assertEqual({authorization for path, params, authorization in self.fake_drive.requests},
+                         {'Bearer test-token'})
+        self.assertEqual(google_services.DriveChangesSync.get_page_token(), '20')
+
+        self.assertEqual(google_services.DriveFolderIndex.get_children('partner-2'),
+                         [{'id': 'offer-b', 'name': 'Offer B'}])
+        self.assertEqual(google_services.DriveFolderIndex.get_children('partner-1'), [])
+        self.assertFalse(google_services.DriveFolderIndex.is_listed('offer-a'))
+
+        self.assertEqual([entry.name.split('-')[1] for entry in google_services.DriveContentCache.get_entries()],
+                         ['b'])
+        self.assertFalse(negative_cache.NegativeCache.contains('drive_folder', 'partner-2/Offer B'))
+        self.assertTrue(negative_cache.NegativeCache.contains('drive_folder', 'partner-3/Offer C'))
+
+        # The folder index is stored, so a fresh load sees the same folders
+        google_services.DriveFolderIndex.children = None
+        self.assertEqual(google_services.DriveFolderIndex.get_children('partner-2'),
+                         [{'id': 'offer-b', 'name': 'Offer B'}])
+
+    def test_interrupted_sync_resumes_from_last_page(self):
+        google_services.DriveChangesSync.set_page_token('10')
+        del self.fake_drive.changes_pages['12']
+
+        google_services.DriveChangesSync.sync()
+        self.assertEqual(google_services.DriveChangesSync.get_page_token(), '12')
+
+        self.fake_drive.changes_pages['12'] = CHANGES_PAGES['12']
+        google_services.DriveChangesSync.sync()
+        self.assertEqual(google_services.DriveChangesSync.get_page_token(), '20')
+
+
+if __name__ == '__main__':
+    unittest.main()